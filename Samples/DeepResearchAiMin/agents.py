@@ -4,38 +4,43 @@ import os
 
 warnings.filterwarnings("ignore")
 from together import Together
+from llm_cache import llm_cache
 
-# Get Client
+# Get Client - one per process, shared by prompt_llm and every agent
 your_api_key = "your_key"
 client = Together(api_key=your_api_key)
 
 
-def prompt_llm(prompt, show_cost=False):
+def prompt_llm(prompt, show_cost=False, use_cache=True):
     # This function allows us to prompt an LLM via the Together API
 
     # model
     model = "meta-llama/Meta-Llama-3-8B-Instruct-Lite"
 
-    # Calculate the number of tokens
-    tokens = len(prompt.split())
+    # Price per million tokens (input, output)
+    input_price, output_price = 0.1, 0.1
 
-    # Calculate and print estimated cost for each model
-    if show_cost:
-        print(f"\nNumber of tokens: {tokens}")
-        cost = (0.1 / 1_000_000) * tokens
-        print(f"Estimated cost for {model}: ${cost:.10f}\n")
+    # Make the API call (byte-identical prompts are served from the response cache)
+    def call():
+        response = client.chat.completions.create(
+            model=model,
+            messages=[{"role": "user", "content": prompt}],
+        )
+        # Calculate and print the cost from the token counts the API reports
+        if show_cost and response.usage is not None:
+            usage = response.usage
+            cost = (usage.prompt_tokens * input_price + usage.completion_tokens * output_price) / 1_000_000
+            print(f"\nTokens: {usage.prompt_tokens} in / {usage.completion_tokens} out")
+            print(f"Cost for {model}: ${cost:.10f}\n")
+        return response.choices[0].message.content
 
-    # Make the API call
-    response = client.chat.completions.create(
-        model=model,
-        messages=[{"role": "user", "content": prompt}],
-    )
-    return response.choices[0].message.content
+    return llm_cache.get_or_call(model, prompt, {}, call, use_cache)
 
 
 class SummarizerAgent:
     def __init__(self):
-        self.client = Together(api_key=your_api_key)
+        # Share the module-level client (and its connections) instead of building one per agent
+        self.client = client
 
     def process(self, content):
         prompt = """SYSTEM: You are an expert text summarizer. 
@@ -59,7 +64,7 @@ class SummarizerAgent:
 
 class InsightAgent:
     def __init__(self):
-        self.client = Together(api_key=your_api_key)
+        self.client = client
 
     def process(self, summary_files):
         # Read all summary files
@@ -101,7 +106,7 @@ class InsightAgent:
 
 class RecommenderAgent:
     def __init__(self):
-        self.client = Together(api_key=your_api_key)
+        self.client = client
 
     def process(self, insights, summaries, user_goal, persona=""):
         prompt = """SYSTEM: You are an expert business consultant who provides actionable recommendations.
@@ -1,32 +1,290 @@
 # Convert to flask
-from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import cosine_similarity
+# Imported first so the startup breakdown covers every other import
+from lazy_imports import startup_timer
 import numpy as np
 from ApiKey import API_KEY, HGToken
-from together import Together
-from flask import Flask, render_template, request, jsonify, session
+from flask import Flask, render_template, request, jsonify, Response, stream_with_context
 import json
+import os
+import queue
+import threading
+import time
+import uuid
+from model_registry import registry, DEFAULT_MODEL
+from vector_index import DenseIndex, QuantizedIndex, load_index, memory_report
+from build_index import load_documents
+from stage_graph import Stage, run_stages
+from concurrent.futures import ThreadPoolExecutor
+from embedding_cache import EmbeddingCache
+from llm_client import get_llm_client, DEFAULT_LLM_MODEL
+from llm_cache import llm_cache
+from usage_tracker import UsageLedger, usage_tracker, count_tokens, load_tokenizer
+from metrics import registry as metrics_registry, Counter, Gauge, Histogram, CallbackMetric
+from structured_output import StructuredOutputError, parse_structured
+from intent_router import IntentRouter
+from semantic_cache import SemanticCache, SEMANTIC_CACHE_SIZE
+from micro_batch import MicroBatchEncoder, ENCODE_BATCH_SIZE
+from feedback_store import get_feedback_store, output_id, parse_feedback_ids, after_fork as feedback_after_fork
+from job_queue import JobQueue, QueueFull
 
-# Function to interact with LLM using Together API
-def prompt_llm(prompt, client=None):
-    if client is None:
-        return "Error: Together client not initialized"
-    
-    try:
-        response = client.chat.completions.create(
-            model="meta-llama/Meta-Llama-3-8B-Instruct-Lite",
-            messages=[{"role": "user", "content": prompt}],
-            max_tokens=150
-        )
-        return response.choices[0].message.content.strip()
-    except Exception as e:
-        return f"Error calling Together API: {str(e)}"
+# sentence_transformers/torch, transformers and faiss are imported lazily, on first use (see lazy_imports.py)
+startup_timer.mark("import app modules")
+
+LLM_PARAMS = {"max_tokens": 150}
+
+# Fused first pass: one call returns analysis, urgency, tone and sentiment as JSON instead of two free-text calls
+FUSED_ANALYSIS = os.environ.get("FUSED_ANALYSIS", "0") == "1"
+FUSED_ANALYSIS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "analysis": {"type": "string"},
+        "urgency": {"type": "string", "enum": ["Low", "Medium", "High"]},
+        "tone": {"type": "string"},
+        "sentiment": {"type": "string"},
+    },
+    "required": ["analysis", "urgency", "tone", "sentiment"],
+}
+# Intent routing: confident routine emails (refills, appointment moves, ...) skip the justifier calls
+INTENT_ROUTING = os.environ.get("INTENT_ROUTING", "0") == "1"
+
+# Semantic result cache: an email that is practically identical to an earlier one reuses that pipeline result.
+# Cached outputs name the earlier sender, their medication etc., so they are only returned verbatim at or above
+# SEMANTIC_CACHE_EXACT. With SEMANTIC_CACHE_ADAPT=1, emails between the cache threshold and that are also
+# served from the cache: the analysis is redone for the new email, the earlier draft is adapted to it and
+# reviewed again, and the justifications are left out (4 calls instead of 6, 3 with FUSED_ANALYSIS=1).
+SEMANTIC_CACHE = os.environ.get("SEMANTIC_CACHE", "0") == "1"
+SEMANTIC_CACHE_ADAPT = os.environ.get("SEMANTIC_CACHE_ADAPT", "0") == "1"
+SEMANTIC_CACHE_EXACT = 0.99
+
+# JSON mode constrains the output to the schema on providers that support it; room for four fields
+FUSED_ANALYSIS_PARAMS = {
+    "max_tokens": 300,
+    "response_format": {"type": "json_object", "schema": FUSED_ANALYSIS_SCHEMA},
+}
+
+# Instrumentation for /metrics; recording only touches a per-thread dict, so it is cheap on every call
+STAGE_SECONDS = Histogram(metrics_registry, "pipeline_stage_seconds", "Time spent in each process_email stage", ["stage"])
+EMAILS_TOTAL = Counter(metrics_registry, "pipeline_emails_total", "Emails processed, by outcome", ["status"])
+EMAILS_IN_FLIGHT = Gauge(metrics_registry, "pipeline_emails_in_flight", "Emails currently being processed")
+LLM_SECONDS = Histogram(metrics_registry, "llm_call_seconds", "LLM call latency by agent role", ["role", "cached"])
+LLM_TOKENS = Counter(metrics_registry, "llm_tokens_total", "LLM tokens by agent role", ["role", "kind"])
+ENCODE_SECONDS = Histogram(metrics_registry, "embedding_encode_seconds", "Query embedding time")
+SEARCH_SECONDS = Histogram(metrics_registry, "retriever_search_seconds", "Vector index search time", ["corpus"])
+ROUTES_TOTAL = Counter(metrics_registry, "pipeline_routes_total", "Emails by routed intent and profile", ["intent", "profile"])
+SEMANTIC_CACHE_LOOKUPS = Counter(metrics_registry, "semantic_cache_lookups_total", "Semantic result cache lookups", ["result"])
+SEMANTIC_CACHE_SIMILARITY = Histogram(
+    metrics_registry, "semantic_cache_similarity", "Best cosine similarity per semantic cache lookup",
+    buckets=(0.5, 0.6, 0.7, 0.8, 0.85, 0.9, 0.92, 0.94, 0.96, 0.98, 0.99, 1.0),
+)
+HTTP_IN_FLIGHT = Gauge(metrics_registry, "http_requests_in_flight", "HTTP requests being served", ["endpoint"])
+
+
+# Function to interact with LLM using Together API (through the shared, pooled client by default)
+# Identical prompts are answered from the response cache unless use_cache=False.
+# Rate limits are retried inside the client; errors that remain are raised rather than returned as text,
+# so an error message can never be passed on to the next agent as if it were a result.
+# Token usage is recorded per role in the process-wide tracker and, when given, the per-email ledger.
+# params are extra generation parameters on top of LLM_PARAMS (e.g. response_format for JSON mode).
+# validate(response) raises to reject an answer; rejected answers are not cached.
+def prompt_llm(prompt, client=None, use_cache=True, on_token=None, role="default", usage=None, params=None,
+               validate=None):
+    client = client or get_llm_client()
+    params = {**LLM_PARAMS, **(params or {})}
+    start = time.perf_counter()
+    called = []
+
+    def call():
+        called.append(True)
+        if on_token is None:
+            data = client.chat(prompt, DEFAULT_LLM_MODEL, **params)
+            response = data["choices"][0]["message"]["content"].strip()
+            reported = data.get("usage")
+        else:
+            # Token-level streaming: each delta is passed to on_token as it arrives
+            parts = []
+            reported = {}
+            for delta in client.stream(prompt, DEFAULT_LLM_MODEL, on_usage=reported.update, **params):
+                parts.append(delta)
+                on_token(delta)
+            response = "".join(parts).strip()
+        record_usage(role, usage, prompt, response, reported, time.perf_counter() - start)
+        return response
+
+    response = llm_cache.get_or_call(DEFAULT_LLM_MODEL, prompt, params, call, use_cache, validate)
+    if not called:
+        # Cache hit: no tokens billed, and a streaming caller gets the whole answer as one chunk
+        record_usage(role, usage, prompt, response, None, time.perf_counter() - start, cached=True)
+        if on_token is not None:
+            on_token(response)
+    return response
+
+
+async def aprompt_llm(prompt, client=None, use_cache=True, role="default", usage=None):
+    client = client or get_llm_client()
+    start = time.perf_counter()
+    key = llm_cache.make_key(DEFAULT_LLM_MODEL, prompt, LLM_PARAMS)
+    if use_cache:
+        cached = llm_cache.get(key)
+        if cached is not None:
+            record_usage(role, usage, prompt, cached, None, time.perf_counter() - start, cached=True)
+            return cached
+
+    data = await client.achat(prompt, DEFAULT_LLM_MODEL, **LLM_PARAMS)
+    response = data["choices"][0]["message"]["content"].strip()
+    record_usage(role, usage, prompt, response, data.get("usage"), time.perf_counter() - start)
+    if use_cache:
+        llm_cache.set(key, response)
+    return response
+
+
+def record_usage(role, usage, prompt, response, reported, seconds, cached=False):
+    # Prefer the API's own usage numbers; estimate with the tokenizer only when they are missing
+    if cached:
+        prompt_tokens = completion_tokens = 0
+        estimated = False
+    elif reported:
+        prompt_tokens = reported.get("prompt_tokens", 0)
+        completion_tokens = reported.get("completion_tokens", 0)
+        estimated = False
+    else:
+        prompt_tokens = count_tokens(prompt, DEFAULT_LLM_MODEL)
+        completion_tokens = count_tokens(response, DEFAULT_LLM_MODEL)
+        estimated = True
+    LLM_SECONDS.observe(seconds, role=role, cached=str(cached).lower())
+    LLM_TOKENS.inc(prompt_tokens, role=role, kind="prompt")
+    LLM_TOKENS.inc(completion_tokens, role=role, kind="completion")
+    for ledger in (usage_tracker, usage):
+        if ledger is not None:
+            ledger.record(role, DEFAULT_LLM_MODEL, prompt_tokens, completion_tokens, seconds, cached, estimated)
+
+
+SIMILARITY_THRESHOLD = 0.3
 
-class EmailResponseRetriever:
+# Corpus embeddings survive restarts and are shared read-only between worker processes
+embedding_cache = EmbeddingCache(DEFAULT_MODEL)
+
+# Optional prebuilt indexes (see build_index.py), e.g. an IVF/HNSW index over a large policy database
+POLICY_INDEX_DIR = os.environ.get("POLICY_INDEX_DIR")
+EXAMPLE_INDEX_DIR = os.environ.get("EXAMPLE_INDEX_DIR")
+# float16 / int8 keep the in-RAM corpus 2x / 4x smaller; candidates are rescored against the memory-mapped cache file
+RETRIEVER_INDEX_DTYPE = os.environ.get("RETRIEVER_INDEX_DTYPE", "float32")
+
+
+_query_encoder = None
+_query_encoder_lock = threading.Lock()
+
+
+def get_query_encoder():
+    # One micro-batching front-end over the shared model, so concurrent query encodes run as one batch
+    global _query_encoder
+    if _query_encoder is None:
+        with _query_encoder_lock:
+            if _query_encoder is None:
+                _query_encoder = MicroBatchEncoder(registry.get(DEFAULT_MODEL))
+    return _query_encoder
+
+
+class RequestMemo:
+    # Per-email memo of query embeddings and retrieval results, shared by every agent for one email
     def __init__(self):
-        self.encoder = SentenceTransformer("all-MiniLM-L6-v2", use_auth_token=HGToken)
+        self._lock = threading.Lock()
+        self._embeddings = {}
+        self._results = {}
+        self.encoder_calls = 0
+        self.retrieval_calls = 0
+        self.retrieval_hits = 0
+
+    def embed(self, encoder, text):
+        key = (id(encoder), text)
+        with self._lock:
+            if key in self._embeddings:
+                return self._embeddings[key]
+        with ENCODE_SECONDS.time():
+            embedding = encoder.encode(text)
+        with self._lock:
+            self.encoder_calls += 1
+            return self._embeddings.setdefault(key, embedding)
+
+    def retrieve(self, key, search):
+        with self._lock:
+            self.retrieval_calls += 1
+            if key in self._results:
+                self.retrieval_hits += 1
+                return self._results[key]
+        matches = search()
+        with self._lock:
+            return self._results.setdefault(key, matches)
+
+    def stats(self):
+        return {
+            "encoder_calls": self.encoder_calls,
+            "retrieval_calls": self.retrieval_calls,
+            "retrieval_hits": self.retrieval_hits,
+        }
+
+
+class CorpusRetriever:
+    # Shared search logic for the example and policy retrievers
+    def __init__(self, corpus_name, documents, empty_message, encoder=None, cache=None, index=None):
+        # Reuse the process-wide model (behind the query micro-batcher) instead of loading MiniLM per retriever
+        self.encoder = encoder or get_query_encoder()
+        self.corpus_name = corpus_name
+        self.documents = documents
+        self.empty_message = empty_message
+        # The default cache is keyed by the default model, so only use it with that model
+        if cache is None and encoder is None:
+            cache = embedding_cache
+        self.cache = cache
+
+        # A prebuilt index is used as-is; otherwise pre-compute embeddings into a single normalized matrix
+        if index is not None:
+            self.index = index
+        elif self.cache is not None:
+            matrix = self.cache.load(corpus_name, documents.values(), self.encode_corpus)
+            if RETRIEVER_INDEX_DTYPE == "float32":
+                self.index = DenseIndex(documents.keys(), matrix, normalized=True)
+            else:
+                self.index = QuantizedIndex(documents.keys(), matrix, dtype=RETRIEVER_INDEX_DTYPE, normalized=True)
+        else:
+            self.index = DenseIndex(documents.keys(), self.encode_corpus(list(documents.values())))
+
+    @classmethod
+    def from_index(cls, directory, encoder=None, **search_params):
+        # Load an index directory written by build_index.py; search_params tune recall vs latency (nprobe, ef)
+        return cls(encoder, load_documents(directory), load_index(directory, **search_params))
+
+    def encode_corpus(self, texts):
+        # One batched encode call for the whole corpus
+        return np.asarray(self.encoder.encode(list(texts), batch_size=ENCODE_BATCH_SIZE))
+
+    def search(self, query, top_k=2, memo=None):
+        if memo is None:
+            with ENCODE_SECONDS.time():
+                query_embedding = self.encoder.encode(query)
+            return self._search_index(query_embedding, top_k)
+        return memo.retrieve(
+            (self.corpus_name, query, top_k),
+            lambda: self._search_index(memo.embed(self.encoder, query), top_k),
+        )
+
+    def _search_index(self, query_embedding, top_k):
+        with SEARCH_SECONDS.time(corpus=self.corpus_name):
+            return self.index.search(query_embedding, top_k, SIMILARITY_THRESHOLD)
+
+    def search_batch(self, queries, top_k=2):
+        # Score many queries with one matrix product
+        query_embeddings = self.encoder.encode(list(queries))
+        return self.index.search_batch(query_embeddings, top_k, SIMILARITY_THRESHOLD)
+
+    def format_matches(self, matches):
+        relevant = [self.documents[name] for name, score in matches]
+        return "\n\n".join(relevant) if relevant else self.empty_message
+
+
+class EmailResponseRetriever(CorpusRetriever):
+    def __init__(self, encoder=None, examples=None, index=None):
         # Sample email response examples with more casual tone
-        self.examples = {
+        self.examples = examples or {
             "medical_records": """
                 ORIGINAL EMAIL:
                 Hey there, I was hoping to get my medical records. What do I need to do?
@@ -74,35 +332,18 @@ class EmailResponseRetriever:
                 Need it sooner? Just let me know!
             """,
         }
-        # Pre-compute embeddings for examples
-        self.example_embeddings = {
-            k: self.encoder.encode(v) for k, v in self.examples.items()
-        }
+        super().__init__("examples", self.examples, "No relevant example found.", encoder, index=index)
 
-    def get_relevant_response(self, query, top_k=2):
-        query_embedding = self.encoder.encode(query)
-        similarities = {
-            k: cosine_similarity([query_embedding], [emb])[0][0]
-            for k, emb in self.example_embeddings.items()
-        }
-        sorted_examples = sorted(similarities.items(), key=lambda x: x[1], reverse=True)
-
-        relevant_examples = []
-        for example_name, score in sorted_examples[:top_k]:
-            if score > 0.3:  # Similarity threshold
-                relevant_examples.append(self.examples[example_name])
+    def get_relevant_response(self, query, top_k=2, memo=None):
+        return self.format_matches(self.search(query, top_k, memo))
 
-        return (
-            "\n\n".join(relevant_examples)
-            if relevant_examples
-            else "No relevant example found."
-        )
+    def get_relevant_responses(self, queries, top_k=2):
+        return [self.format_matches(m) for m in self.search_batch(queries, top_k)]
 
-class PolicyRetriever:
-    def __init__(self):
-        self.encoder = SentenceTransformer("all-MiniLM-L6-v2", use_auth_token=HGToken)
+class PolicyRetriever(CorpusRetriever):
+    def __init__(self, encoder=None, policies=None, index=None):
         # Sample medical policies - in production, this would come from a database
-        self.policies = {
+        self.policies = policies or {
             "privacy": """
                 Patient Privacy Policy:
                 - All patient information is confidential and protected under HIPAA
@@ -128,36 +369,178 @@ class PolicyRetriever:
                 - Generic alternatives offered when available
             """,
         }
-        # Pre-compute embeddings for policies
-        self.policy_embeddings = {
-            k: self.encoder.encode(v) for k, v in self.policies.items()
-        }
+        super().__init__("policies", self.policies, "No relevant policy found.", encoder, index=index)
 
-    def get_relevant_policy(self, query, top_k=2):
-        query_embedding = self.encoder.encode(query)
-        similarities = {
-            k: cosine_similarity([query_embedding], [emb])[0][0]
-            for k, emb in self.policy_embeddings.items()
-        }
-        sorted_policies = sorted(similarities.items(), key=lambda x: x[1], reverse=True)
+    def get_relevant_policy(self, query, top_k=2, memo=None):
+        return self.format_matches(self.search(query, top_k, memo))
 
-        relevant_policies = []
-        for policy_name, score in sorted_policies[:top_k]:
-            if score > 0.3:  # Similarity threshold
-                relevant_policies.append(self.policies[policy_name])
+    def get_relevant_policies(self, queries, top_k=2):
+        return [self.format_matches(m) for m in self.search_batch(queries, top_k)]
+
+# Retrievers are shared by every agent and request; the corpora are encoded once per process
+_retrievers = None
+_retrievers_lock = threading.Lock()
+retriever_stats = {"build_count": 0, "build_seconds": 0.0}
+
+
+def get_shared_retrievers():
+    global _retrievers
+    if _retrievers is None:
+        with _retrievers_lock:
+            if _retrievers is None:
+                start = time.perf_counter()
+                response_retriever = (
+                    EmailResponseRetriever.from_index(EXAMPLE_INDEX_DIR) if EXAMPLE_INDEX_DIR else EmailResponseRetriever()
+                )
+                policy_retriever = PolicyRetriever.from_index(POLICY_INDEX_DIR) if POLICY_INDEX_DIR else PolicyRetriever()
+                _retrievers = (response_retriever, policy_retriever)
+                retriever_stats["build_count"] += 1
+                retriever_stats["build_seconds"] += time.perf_counter() - start
+    return _retrievers
+
+
+# Shared by every EmailProcessingSystem in the process when SEMANTIC_CACHE=1; SEMANTIC_CACHE_SIZE=0 also turns it off
+result_cache = SemanticCache() if SEMANTIC_CACHE and SEMANTIC_CACHE_SIZE > 0 else None
+
+_intent_router = None
+_intent_router_lock = threading.Lock()
+
+
+def get_intent_router():
+    # Centroids come from the shared example retriever's embeddings, so building the router encodes nothing new
+    global _intent_router
+    if _intent_router is None:
+        response_retriever, _ = get_shared_retrievers()
+        with _intent_router_lock:
+            if _intent_router is None:
+                _intent_router = IntentRouter.from_retriever(response_retriever)
+    return _intent_router
+
+
+_job_queue = None
+_job_queue_lock = threading.Lock()
+
+
+def run_job(payload, on_stage):
+    return get_email_system().process_email(payload["email"], on_stage=on_stage)
+
+
+def get_job_queue():
+    # Background workers for /jobs; started once the app is up (not in a pre-fork parent) so jobs
+    # persisted before a restart resume
+    global _job_queue
+    if _job_queue is None:
+        with _job_queue_lock:
+            if _job_queue is None:
+                _job_queue = JobQueue(run_job)
+    return _job_queue
+
+
+# Readiness for /readyz: the server accepts connections right away and warms up in the background
+# (or, under prefork_server.py, before forking)
+warmup_state = {"ready": False, "error": None}
+
+
+def warmup():
+    # Load the embedding model, encode the corpora and open LLM connections before the first request arrives
+    start = time.perf_counter()
+    with startup_timer.phase("load embedding model"):
+        registry.warmup()
+    with startup_timer.phase("build retrievers"):
+        get_shared_retrievers()
+    with startup_timer.phase("build email system"):
+        get_email_system()
+    with startup_timer.phase("open LLM connections"):
+        get_llm_client().warmup()
+    with startup_timer.phase("load tokenizer"):
+        load_tokenizer(DEFAULT_LLM_MODEL)
+    warmup_state["ready"] = True
+    print(f"Warmup finished in {time.perf_counter() - start:.2f}s: {runtime_stats()}")
+
+
+def after_fork():
+    # Runs in each pre-forked worker (see prefork_server.py): models and corpora stay shared copy-on-write,
+    # but connections, threads and SQLite handles have to be the worker's own
+    global stage_executor
+    client = get_llm_client()
+    client.after_fork()
+    # The provider's limits apply to all workers together
+    client.limiter.split(int(os.environ.get("WEB_WORKERS", "1")))
+    llm_cache.after_fork()
+    feedback_after_fork()
+    if _job_queue is not None:
+        _job_queue.after_fork()
+    else:
+        get_job_queue()
+    if _query_encoder is not None:
+        _query_encoder.after_fork()
+    parent_executor = stage_executor
+    stage_executor = ThreadPoolExecutor(max_workers=STAGE_WORKERS, thread_name_prefix="stage")
+    if _email_system is not None and _email_system.executor is parent_executor:
+        _email_system.executor = stage_executor
+    if not warmup_state["ready"]:
+        start_background_warmup()
+
+
+def start_background_warmup():
+    def run():
+        try:
+            warmup()
+            with startup_timer.phase("start job workers"):
+                get_job_queue()
+            print(f"Ready: {startup_timer.report()}")
+        except Exception as e:
+            warmup_state["error"] = f"{type(e).__name__}: {e}"
+            print(f"Warmup failed: {warmup_state['error']}")
+
+    thread = threading.Thread(target=run, daemon=True, name="warmup")
+    thread.start()
+    return thread
+
+
+def runtime_stats():
+    return {
+        "models": registry.stats(),
+        "embedding_cache": embedding_cache.stats(),
+        "llm_cache": llm_cache.stats(),
+        "llm_rate_limiter": get_llm_client().limiter.stats(),
+        "retrievers": {
+            "build_count": retriever_stats["build_count"],
+            "build_seconds": round(retriever_stats["build_seconds"], 3),
+            "index_memory": {
+                retriever.corpus_name: {
+                    key: value for key, value in memory_report(retriever.index).items() if key != "arrays"
+                }
+                for retriever in (_retrievers or ())
+            },
+        },
+        "intent_router": _intent_router.stats() if _intent_router is not None else None,
+        "semantic_cache": result_cache.stats() if result_cache is not None else None,
+        "query_encoder": _query_encoder.stats() if _query_encoder is not None else None,
+    }
+
+
+# Cache counters already exist in the caches themselves; they are read when /metrics is scraped
+CallbackMetric(
+    metrics_registry, "llm_cache_lookups_total", "LLM response cache lookups by result", "counter",
+    lambda: [({"result": result}, llm_cache.stats()[result]) for result in ("hits", "disk_hits", "misses", "bypassed")],
+)
+CallbackMetric(
+    metrics_registry, "embedding_cache_rows_total", "Corpus embedding rows reused from or added to the cache", "counter",
+    lambda: [({"result": result}, embedding_cache.stats()[result]) for result in ("hits", "misses")],
+)
 
-        return (
-            "\n\n".join(relevant_policies)
-            if relevant_policies
-            else "No relevant policy found."
-        )
 
 class EmailAgent:
-    def __init__(self, role, client):
+    def __init__(self, role, client, response_retriever=None, policy_retriever=None):
         self.role = role
         self.client = client
-        self.response_retriever = EmailResponseRetriever()
-        self.policy_retriever = PolicyRetriever()
+        if response_retriever is None or policy_retriever is None:
+            shared_response_retriever, shared_policy_retriever = get_shared_retrievers()
+            response_retriever = response_retriever or shared_response_retriever
+            policy_retriever = policy_retriever or shared_policy_retriever
+        self.response_retriever = response_retriever
+        self.policy_retriever = policy_retriever
 
         self.prompts = {
             "analyzer": """SYSTEM: You are an expert email analyzer for a medical company.
@@ -220,6 +603,25 @@ class EmailAgent:
             {policies}
 
             Evaluate this draft response: {content}""",
+            "analyzer_sentiment": """SYSTEM: You are an expert email analyzer for a medical company.
+            Analyze the email's content and its sentiment in one pass.
+
+            INSTRUCTIONS:
+            • Respond with a single JSON object and nothing else, with exactly these fields:
+              "analysis": main topics, key points, required actions and any compliance concerns (50 words maximum)
+              "urgency": one of "Low", "Medium", "High"
+              "tone": tone of the message (formal, informal, urgent, etc.)
+              "sentiment": overall sentiment, emotional undertones, stress indicators and any concerning language
+              (30 words maximum)
+            • Consider similar past responses and relevant policies
+
+            SIMILAR PAST RESPONSES:
+            {examples}
+
+            RELEVANT POLICIES:
+            {policies}
+
+            Email: {content}""",
             "sentiment": """SYSTEM: You are an expert in analyzing email sentiment and emotional context in
             healthcare communications.
 
@@ -234,6 +636,17 @@ class EmailAgent:
             • Show response only without additional commentary
 
             Email: {content}""",
+            "adapter": """SYSTEM: You are a professional email response specialist for a medical company.
+            A previous reply was written for an email that is almost identical to a new one. Adapt it to the new email.
+
+            INSTRUCTIONS:
+            • Keep the content, next steps and friendly tone of the previous reply
+            • Change only details that differ in the new email (names, dates, medications, insurers, etc.)
+            • Ensure HIPAA compliance in all content
+            • Limit response to 50 words maximum
+            • Show response only without additional commentary
+
+            {content}""",
             "example_justifier": """SYSTEM: You are an example matching expert. In 2 lines, explain why the following example responses are relevant
             to this email content. Be specific and concise.
 
@@ -246,69 +659,279 @@ class EmailAgent:
             Selected policies: {policies}""",
         }
 
-    def process(self, content):
-        # Get relevant example responses for the email content
-        relevant_examples = self.response_retriever.get_relevant_response(content)
-        relevant_policies = self.policy_retriever.get_relevant_policy(content)
+    def process(self, content, memo=None, examples=None, policies=None, on_token=None, usage=None, params=None):
+        # Only retrieve what this role's prompt actually uses, unless the caller already has it
+        prompt = self.prompts[self.role]
+        if examples is None and "{examples}" in prompt:
+            examples = self.response_retriever.get_relevant_response(content, memo=memo)
+        if policies is None and "{policies}" in prompt:
+            policies = self.policy_retriever.get_relevant_policy(content, memo=memo)
         return prompt_llm(
-            self.prompts[self.role].format(content=content, examples=relevant_examples, policies=relevant_policies),
-            self.client
+            prompt.format(content=content, examples=examples, policies=policies),
+            self.client,
+            on_token=on_token,
+            role=self.role,
+            usage=usage,
+            params=params,
         )
 
+    def analyze_structured(self, content, memo=None, examples=None, policies=None, usage=None):
+        # Fused analysis + sentiment; raises StructuredOutputError if the answer doesn't match the schema
+        prompt = self.prompts["analyzer_sentiment"]
+        if examples is None:
+            examples = self.response_retriever.get_relevant_response(content, memo=memo)
+        if policies is None:
+            policies = self.policy_retriever.get_relevant_policy(content, memo=memo)
+        response = prompt_llm(
+            prompt.format(content=content, examples=examples, policies=policies),
+            self.client,
+            role="analyzer_sentiment",
+            usage=usage,
+            params=FUSED_ANALYSIS_PARAMS,
+            # A malformed answer raises here without being cached, so the same email retries the fused call
+            validate=lambda text: parse_structured(text, FUSED_ANALYSIS_SCHEMA),
+        )
+        return parse_structured(response, FUSED_ANALYSIS_SCHEMA)
+
+
+# Shared by all requests; stages never wait on each other inside a worker, so a small pool is enough
+STAGE_WORKERS = int(os.environ.get("STAGE_WORKERS", "8"))
+stage_executor = ThreadPoolExecutor(max_workers=STAGE_WORKERS, thread_name_prefix="stage")
+
 
 class EmailProcessingSystem:
-    def __init__(self, client):
-        self.analyzer = EmailAgent("analyzer", client)
-        self.drafter = EmailAgent("drafter", client)
-        self.reviewer = EmailAgent("reviewer", client)
-        self.example_justifier = EmailAgent("example_justifier", client)
-        self.policy_justifier = EmailAgent("policy_justifier", client)
-
-    def process_email(self, email_content):
-        # Step 1: Analyze email content
-        print("\nAnalyzing email content...")
-        analysis = self.analyzer.process(email_content)
-
-        # Step 2: Analyze sentiment
-        sentiment = prompt_llm(
-            self.analyzer.prompts["sentiment"].format(content=email_content),
-            self.analyzer.client
-        )
+    def __init__(self, client, executor=None, fused_analysis=FUSED_ANALYSIS, intent_routing=INTENT_ROUTING,
+                 semantic_cache=result_cache, adapt_cached=SEMANTIC_CACHE_ADAPT):
+        # Bulk runs pass a larger executor so concurrent emails don't queue behind each other's stages
+        self.executor = executor or stage_executor
+        self.fused_analysis = fused_analysis
+        self.router = get_intent_router() if intent_routing else None
+        self.semantic_cache = semantic_cache
+        self.adapt_cached = adapt_cached
+        response_retriever, policy_retriever = get_shared_retrievers()
+        self.analyzer = EmailAgent("analyzer", client, response_retriever, policy_retriever)
+        self.drafter = EmailAgent("drafter", client, response_retriever, policy_retriever)
+        self.reviewer = EmailAgent("reviewer", client, response_retriever, policy_retriever)
+        self.example_justifier = EmailAgent("example_justifier", client, response_retriever, policy_retriever)
+        self.policy_justifier = EmailAgent("policy_justifier", client, response_retriever, policy_retriever)
+        self.adapter = EmailAgent("adapter", client, response_retriever, policy_retriever)
 
-        # Step 3: Draft response
-        print("\nDrafting response based on analysis...")
-        draft = self.drafter.process(analysis)
+    def build_stages(self, email_content, memo, on_token=None, usage=None):
+        # Only analyzer -> drafter -> reviewer is a real chain; everything else needs just the raw email
+        def retrieve_context(_):
+            # Relevant policies and example responses for the email itself (display + justifiers + analyzer)
+            return {
+                "policies": self.analyzer.policy_retriever.get_relevant_policy(email_content, memo=memo),
+                "examples": self.analyzer.response_retriever.get_relevant_response(email_content, memo=memo),
+            }
 
-        # Get relevant policies and example responses for display
-        relevant_policies = self.analyzer.policy_retriever.get_relevant_policy(email_content)
-        relevant_examples = self.analyzer.response_retriever.get_relevant_response(email_content)
+        def analyze_fused(inputs):
+            # None sends the analysis and sentiment stages back to their own calls
+            from requests import HTTPError
 
-        # Add policy justification
-        policy_justification = self.policy_justifier.process(
-            f"Email: {email_content}\nPolicies: {relevant_policies}"
-        )
+            print("\nAnalyzing email content and sentiment...")
+            context = inputs["context"]
+            try:
+                return self.analyzer.analyze_structured(
+                    email_content, memo, examples=context["examples"], policies=context["policies"], usage=usage
+                )
+            except (StructuredOutputError, HTTPError) as e:
+                # HTTPError covers models/providers that reject response_format
+                print(f"Fused analysis unusable, falling back to two calls: {e}")
+                return None
 
-        # Add example justification
-        example_justification = self.example_justifier.process(
-            f"Email: {email_content}\nExamples: {relevant_examples}"
-        )
+        def analyze(inputs):
+            structured = inputs.get("structured_analysis")
+            if structured is not None:
+                return f"{structured['analysis']}\nUrgency: {structured['urgency']}\nTone: {structured['tone']}"
+            print("\nAnalyzing email content...")
+            context = inputs["context"]
+            return self.analyzer.process(
+                email_content, memo, examples=context["examples"], policies=context["policies"], usage=usage
+            )
+
+        def analyze_sentiment(inputs):
+            structured = inputs.get("structured_analysis")
+            if structured is not None:
+                return structured["sentiment"]
+            return prompt_llm(
+                self.analyzer.prompts["sentiment"].format(content=email_content),
+                self.analyzer.client,
+                role="sentiment",
+                usage=usage
+            )
+
+        def draft(inputs):
+            print("\nDrafting response based on analysis...")
+            return self.drafter.process(inputs["analysis"], memo, on_token=on_token, usage=usage)
+
+        def justify_policies(inputs):
+            relevant_policies = inputs["context"]["policies"]
+            return self.policy_justifier.process(
+                f"Email: {email_content}\nPolicies: {relevant_policies}",
+                memo,
+                policies=relevant_policies,
+                usage=usage,
+            )
+
+        def justify_examples(inputs):
+            relevant_examples = inputs["context"]["examples"]
+            return self.example_justifier.process(
+                f"Email: {email_content}\nExamples: {relevant_examples}",
+                memo,
+                examples=relevant_examples,
+                usage=usage,
+            )
+
+        def review(inputs):
+            return self.reviewer.process(inputs["draft"], memo, usage=usage)
+
+        if self.fused_analysis:
+            first_pass = [
+                Stage("context", retrieve_context),
+                Stage("structured_analysis", analyze_fused, deps=["context"]),
+                Stage("analysis", analyze, deps=["context", "structured_analysis"]),
+                Stage("sentiment", analyze_sentiment, deps=["structured_analysis"]),
+            ]
+        else:
+            first_pass = [
+                Stage("context", retrieve_context),
+                Stage("analysis", analyze, deps=["context"]),
+                Stage("sentiment", analyze_sentiment),
+            ]
+        return first_pass + [
+            Stage("draft", draft, deps=["analysis"]),
+            Stage("policy_justification", justify_policies, deps=["context"]),
+            Stage("example_justification", justify_examples, deps=["context"]),
+            Stage("review", review, deps=["draft"]),
+        ]
+
+    def process_email(self, email_content, on_stage=None, on_token=None):
+        # on_stage(name, result) fires as each stage finishes; on_token(text) receives draft tokens as they stream
+        # Every retrieval for this email goes through one memo, so each distinct text is encoded once
+        memo = RequestMemo()
+        # Tokens, cost and LLM latency for this email, by agent role
+        usage = UsageLedger()
+        embedding = None
+        if self.router is not None or self.semantic_cache is not None:
+            # The email's embedding is memoized, so the context stage reuses it for retrieval
+            embedding = memo.embed(self.analyzer.response_retriever.encoder, email_content)
+
+        similarity = None
+        if self.semantic_cache is not None:
+            # Without adaptation only a practically identical email may reuse an earlier result
+            cached, similarity = self.semantic_cache.lookup(
+                embedding, threshold=None if self.adapt_cached else max(self.semantic_cache.threshold, SEMANTIC_CACHE_EXACT)
+            )
+            SEMANTIC_CACHE_LOOKUPS.inc(result="miss" if cached is None else "hit")
+            if similarity is not None:
+                SEMANTIC_CACHE_SIMILARITY.observe(similarity)
+            if cached is not None:
+                return self.reuse_result(email_content, cached, similarity, memo, usage, on_stage, on_token)
 
-        # Step 4: Review response
-        review = self.reviewer.process(draft)
+        stages = self.build_stages(email_content, memo, on_token, usage)
+        routing = None
+        if self.router is not None:
+            routing = self.router.route(embedding)
+            ROUTES_TOTAL.inc(intent=routing["intent"], profile=routing["profile"])
+            stages = [stage for stage in stages if stage.name not in routing["skipped_stages"]]
+        status = "error"
+        try:
+            with EMAILS_IN_FLIGHT.track():
+                results, timings = run_stages(stages, self.executor, on_complete=on_stage)
+            status = "success"
+        finally:
+            EMAILS_TOTAL.inc(status=status)
+        # Includes a "total" series for the whole pipeline
+        for stage, timing in timings.items():
+            STAGE_SECONDS.observe(timing["seconds"], stage=stage)
 
+        if self.semantic_cache is not None:
+            # The entry's email is only ever shown to the adapter prompt; callers get its opaque ID
+            self.semantic_cache.add(embedding, {"id": uuid.uuid4().hex, "email": email_content, "results": results, "routing": routing})
+        result = self.build_result(results, routing, memo, timings, usage)
+        result["semantic_cache"] = {"hit": False, "similarity": None if similarity is None else round(similarity, 4)}
+        return result
+
+    def reuse_result(self, email_content, cached, similarity, memo, usage, on_stage=None, on_token=None):
+        # Semantic cache hit. A practically identical email replays the earlier stage results; anything less
+        # similar keeps nothing written about the earlier sender except the draft, which is adapted to this email
+        if similarity >= SEMANTIC_CACHE_EXACT:
+            start = time.perf_counter()
+            results = dict(cached["results"])
+            if on_token is not None:
+                on_token(results["draft"])
+            if on_stage is not None:
+                for name, value in results.items():
+                    on_stage(name, value)
+            timings = {"total": {"start": 0.0, "seconds": round(time.perf_counter() - start, 4)}}
+        else:
+            def adapt_draft(_):
+                return self.adapter.process(
+                    f"New email: {email_content}\n\nPrevious email: {cached['email']}\n\nPrevious reply: {cached['results']['draft']}",
+                    memo,
+                    on_token=on_token,
+                    usage=usage,
+                )
+
+            # Context, analysis and sentiment are redone for this email; the review then checks the adapted draft
+            stages = [
+                stage for stage in self.build_stages(email_content, memo, on_token, usage)
+                if stage.name not in ("draft", "policy_justification", "example_justification")
+            ]
+            stages.append(Stage("draft", adapt_draft))
+            with EMAILS_IN_FLIGHT.track():
+                results, timings = run_stages(stages, self.executor, on_complete=on_stage)
+
+        EMAILS_TOTAL.inc(status="semantic_cache")
+        for stage, timing in timings.items():
+            STAGE_SECONDS.observe(timing["seconds"], stage=stage)
+        result = self.build_result(results, cached["routing"], memo, timings, usage)
+        result["semantic_cache"] = {"hit": True, "similarity": round(similarity, 4), "matched_id": cached["id"]}
+        return result
+
+    def build_result(self, results, routing, memo, timings, usage):
         return {
             "status": "success",
-            "analysis": analysis,
-            "final_draft": draft,
-            "review": review,
-            "policies": relevant_policies,
-            "examples": relevant_examples,
-            "policy_justification": policy_justification,
-            "example_justification": example_justification,
-            "sentiment": sentiment
+            # Sent back with /approve and /disapprove so feedback is tied to exactly these outputs
+            "result_id": uuid.uuid4().hex,
+            "stage_ids": {
+                name: output_id(results[name])
+                for name in ("analysis", "draft", "review", "sentiment", "policy_justification", "example_justification")
+                if results.get(name) is not None
+            },
+            "analysis": results["analysis"],
+            "final_draft": results["draft"],
+            "review": results["review"],
+            "policies": results["context"]["policies"],
+            "examples": results["context"]["examples"],
+            # None when the routed profile skipped them
+            "policy_justification": results.get("policy_justification"),
+            "example_justification": results.get("example_justification"),
+            "sentiment": results["sentiment"],
+            # Urgency/tone/sentiment fields in fused mode; None on the two-call path or after a fallback
+            "structured_analysis": results.get("structured_analysis"),
+            "routing": routing,
+            "memo": memo.stats(),
+            "timings": timings,
+            "usage": usage.summary()
         }
 
 
+_email_system = None
+_email_system_lock = threading.Lock()
+
+
+def get_email_system():
+    # One system per process, bound to the shared LLM client
+    global _email_system
+    if _email_system is None:
+        with _email_system_lock:
+            if _email_system is None:
+                _email_system = EmailProcessingSystem(get_llm_client())
+    return _email_system
+
+
 # Sample emails for testing
 sample_emails = [
     """Hi, I need to get my medical records from last month's visit.
@@ -326,7 +949,21 @@ sample_emails = [
 
 # Flask application
 app = Flask(__name__)
-app.secret_key = 'medical_email_system_secret_key'  # For session management
+
+
+@app.before_request
+def track_request_start():
+    request.metrics_endpoint = request.endpoint or "unknown"
+    HTTP_IN_FLIGHT.inc(endpoint=request.metrics_endpoint)
+
+
+@app.teardown_request
+def track_request_end(_):
+    # stream_with_context tears the same request down again after the stream, so only count it once
+    endpoint = getattr(request, "metrics_endpoint", None)
+    if endpoint is not None:
+        request.metrics_endpoint = None
+        HTTP_IN_FLIGHT.dec(endpoint=endpoint)
 
 
 @app.route('/')
@@ -339,16 +976,8 @@ def process():
     email_content = request.form.get('email')
     
     try:
-        # Initialize Together client
-        client = Together(api_key=API_KEY)
-        
-        email_system = EmailProcessingSystem(client)
-        result = email_system.process_email(email_content)
-        
-        # Store stats in session
-        if 'approved_count' not in session:
-            session['approved_count'] = 0
-            session['disapproved_count'] = 0
+        # Reuse the process-wide system and its pooled LLM connections
+        result = get_email_system().process_email(email_content)
         
         return jsonify(result)
     except Exception as e:
@@ -358,37 +987,169 @@ def process():
         })
 
 
+@app.route('/process_stream', methods=['POST'])
+def process_stream():
+    # Same pipeline as /process, but each stage result is pushed as a server-sent event when it finishes
+    email_content = request.form.get('email')
+    stream_tokens = request.form.get('stream_tokens', 'true') == 'true'
+
+    events = queue.Queue()
+
+    def run():
+        try:
+            result = get_email_system().process_email(
+                email_content,
+                on_stage=lambda name, value: events.put(("stage", {"stage": name, "result": value})),
+                on_token=(lambda text: events.put(("token", {"stage": "draft", "text": text}))) if stream_tokens else None,
+            )
+            events.put(("done", {
+                "status": "success",
+                "result_id": result["result_id"],
+                "stage_ids": result["stage_ids"],
+                "memo": result["memo"],
+                "timings": result["timings"],
+                "usage": result["usage"],
+            }))
+        except Exception as e:
+            events.put(("error", {"status": "error", "message": f"Error processing email: {str(e)}"}))
+        events.put(None)
+
+    threading.Thread(target=run, daemon=True).start()
+
+    def generate():
+        while True:
+            item = events.get()
+            if item is None:
+                return
+            event, data = item
+            yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.route('/jobs', methods=['POST'])
+def submit_job():
+    # Returns at once; poll GET /jobs/<job_id> for stage-by-stage progress and the final result
+    email_content = request.form.get('email')
+    if not email_content:
+        return jsonify({"status": "error", "message": "No email provided"}), 400
+    try:
+        job_id = get_job_queue().submit({"email": email_content})
+    except QueueFull as e:
+        return jsonify({"status": "error", "message": f"Job queue is full: {e}"}), 429
+    return jsonify({"job_id": job_id, "status": "queued"}), 202
+
+
+@app.route('/jobs', methods=['GET'])
+def job_queue_stats():
+    return jsonify(get_job_queue().stats())
+
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    job = get_job_queue().get(job_id)
+    if job is None:
+        return jsonify({"status": "error", "message": "Unknown or expired job"}), 404
+    return jsonify(job)
+
+
+@app.route('/jobs/<job_id>/result', methods=['GET'])
+def get_job_result(job_id):
+    # 200 with the same body as /process once done; 202 while queued or running
+    job = get_job_queue().get(job_id)
+    if job is None:
+        return jsonify({"status": "error", "message": "Unknown or expired job"}), 404
+    if job["status"] == "done":
+        return jsonify(job["result"])
+    if job["status"] in ("queued", "running"):
+        return jsonify({"job_id": job_id, "status": job["status"]}), 202
+    return jsonify({"job_id": job_id, "status": job["status"], "message": job["error"]}), 410
+
+
+@app.route('/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    status = get_job_queue().cancel(job_id)
+    if status is None:
+        return jsonify({"status": "error", "message": "Unknown or expired job"}), 404
+    return jsonify({"job_id": job_id, "status": status})
+
+
+def record_feedback(verdict):
+    # Queued for the feedback store's writer thread; the response never waits on SQLite
+    try:
+        result_id, stage_ids = parse_feedback_ids(request.form.get('result_id'), request.form.get('stage_ids'))
+    except ValueError as e:
+        # Also covers stage_ids that aren't valid JSON
+        return jsonify({"status": "error", "message": f"Invalid feedback IDs: {e}"}), 400
+    store = get_feedback_store()
+    store.record(verdict, result_id=result_id, stage_ids=stage_ids)
+    return jsonify({"status": "success", **store.stats()})
+
+
 @app.route('/approve', methods=['POST'])
 def approve():
-    session['approved_count'] = session.get('approved_count', 0) + 1
-    return jsonify({
-        "status": "success", 
-        "approved_count": session['approved_count'],
-        "disapproved_count": session['disapproved_count']
-    })
+    return record_feedback("approved")
 
 
 @app.route('/disapprove', methods=['POST'])
 def disapprove():
-    session['disapproved_count'] = session.get('disapproved_count', 0) + 1
-    return jsonify({
-        "status": "success", 
-        "approved_count": session['approved_count'],
-        "disapproved_count": session['disapproved_count']
-    })
+    return record_feedback("disapproved")
+
+
+@app.route('/runtime_stats', methods=['GET'])
+def get_runtime_stats():
+    # Model loads and retriever builds should stay at 1 no matter how many emails are processed
+    return jsonify(runtime_stats())
+
+
+@app.route('/usage', methods=['GET'])
+def get_usage():
+    # Tokens, cost and LLM latency since startup, by agent role and by model
+    return jsonify(usage_tracker.summary())
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    # Prometheus text exposition format
+    return Response(metrics_registry.render(), mimetype="text/plain; version=0.0.4")
+
+
+@app.route('/healthz', methods=['GET'])
+def healthz():
+    # Liveness: the process is up and serving, whether or not warmup has finished
+    return jsonify({"status": "ok"})
+
+
+@app.route('/readyz', methods=['GET'])
+def readyz():
+    # Readiness: 503 until the models, corpora and LLM connections are warm, with a startup timing breakdown
+    if warmup_state["ready"]:
+        return jsonify({"status": "ready", "startup": startup_timer.report()})
+    status = "failed" if warmup_state["error"] else "warming_up"
+    return jsonify({"status": status, "error": warmup_state["error"], "startup": startup_timer.report()}), 503
 
 
 @app.route('/stats', methods=['GET'])
 def get_stats():
-    return jsonify({
-        "approved_count": session.get('approved_count', 0),
-        "disapproved_count": session.get('disapproved_count', 0)
-    })
+    # Totals across all workers and restarts, from the feedback store's cached aggregate
+    return jsonify(get_feedback_store().stats())
+
+
+@app.route('/feedback/<result_id>', methods=['GET'])
+def get_feedback(result_id):
+    return jsonify({"result_id": result_id, "events": get_feedback_store().events_for(result_id)})
 
 
 if __name__ == "__main__":
     try:
-        app.run(debug=True)
+        # Warm up alongside the server instead of before it; /readyz reports when it's done
+        start_background_warmup()
+        # The reloader would start a second process and load the models again
+        app.run(debug=True, use_reloader=False)
     except Exception as e:
         print(f"Error launching application: {str(e)}")
         print("Check that API_KEY is properly set in ApiKey.py")
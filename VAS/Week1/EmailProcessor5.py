@@ -4,8 +4,6 @@
 
 from ApiKey import API_KEY, HGToken
 # import libraries
-import requests
-from PIL import Image
 import numpy as np  # Added numpy import
 import sys  # Added sys import
 
@@ -16,9 +14,6 @@ warnings.filterwarnings("ignore")
 try:
     import gradio as gr
     from together import Together
-    import sentence_transformers
-    from sentence_transformers import SentenceTransformer
-    from sklearn.metrics.pairwise import cosine_similarity
 except ImportError:
     # Note: The pip install commands below won't work in a regular Python script
     # You'll need to install these packages before running this script
@@ -29,8 +24,12 @@ except ImportError:
     subprocess.check_call(["pip", "install", "-q", "sentence-transformers"])
     import gradio as gr
     from together import Together
-    from sentence_transformers import SentenceTransformer
-    from sklearn.metrics.pairwise import cosine_similarity
+
+from lazy_imports import lazy_import
+
+# Loaded on first use: sentence_transformers (and torch) when a retriever is built, sklearn on the first search
+sentence_transformers = lazy_import("sentence_transformers")
+pairwise = lazy_import("sklearn.metrics.pairwise")
 
 # Get Client
 client = Together(api_key=API_KEY)
@@ -68,6 +67,10 @@ def gen_image(prompt, width=256, height=256):
     image_url = response.data[0].url
     image_filename = "image.png"
 
+    # Only the image helper needs these, so they are imported on first use instead of at startup
+    import requests
+    from PIL import Image
+
     # Download the image using requests instead of wget
     response = requests.get(image_url)
     with open(image_filename, "wb") as f:
@@ -79,7 +82,7 @@ def gen_image(prompt, width=256, height=256):
 
 class EmailResponseRetriever:
     def __init__(self):
-        self.encoder = SentenceTransformer("all-MiniLM-L6-v2", use_auth_token=HGToken)
+        self.encoder = sentence_transformers.SentenceTransformer("all-MiniLM-L6-v2", use_auth_token=HGToken)
         # Sample email responses - in production, this would come from a database
         self.examples = {
             "late_delivery": """
@@ -128,7 +131,7 @@ class EmailResponseRetriever:
     def get_relevant_example(self, query, top_k=2):
         query_embedding = self.encoder.encode(query)
         similarities = {
-            k: cosine_similarity([query_embedding], [emb])[0][0]
+            k: pairwise.cosine_similarity([query_embedding], [emb])[0][0]
             for k, emb in self.example_embeddings.items()
         }
         sorted_examples = sorted(similarities.items(), key=lambda x: x[1], reverse=True)
@@ -146,7 +149,7 @@ class EmailResponseRetriever:
 
 class PolicyRetriever:
     def __init__(self):
-        self.encoder = SentenceTransformer("all-MiniLM-L6-v2", use_auth_token=HGToken)
+        self.encoder = sentence_transformers.SentenceTransformer("all-MiniLM-L6-v2", use_auth_token=HGToken)
         # Sample medical policies - in production, this would come from a database
         self.policies = {
             "privacy": """
@@ -182,7 +185,7 @@ class PolicyRetriever:
     def get_relevant_policy(self, query, top_k=2):
         query_embedding = self.encoder.encode(query)
         similarities = {
-            k: cosine_similarity([query_embedding], [emb])[0][0]
+            k: pairwise.cosine_similarity([query_embedding], [emb])[0][0]
             for k, emb in self.policy_embeddings.items()
         }
         sorted_policies = sorted(similarities.items(), key=lambda x: x[1], reverse=True)
@@ -497,7 +500,7 @@ def main():
             # Get similarity scores for all examples
             query_embedding = retriever.encoder.encode(query)
             similarities = {
-                k: cosine_similarity([query_embedding], [emb])[0][0]
+                k: pairwise.cosine_similarity([query_embedding], [emb])[0][0]
                 for k, emb in retriever.example_embeddings.items()
             }
 
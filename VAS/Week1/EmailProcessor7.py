@@ -3,10 +3,9 @@
 # - It analyzes the email, finds similar past responses, drafts a reply in a friendly tone, and reviews it for accuracy and compliance.
 from ApiKey import API_KEY, HGToken
 # import libraries
-import requests
-from PIL import Image
 import numpy as np  # Added numpy import
 import sys  # Added sys import
+from structured_output import StructuredOutputError, parse_structured
 
 # suppress warnings
 import warnings
@@ -15,9 +14,6 @@ warnings.filterwarnings("ignore")
 try:
     import gradio as gr
     from together import Together
-    import sentence_transformers
-    from sentence_transformers import SentenceTransformer
-    from sklearn.metrics.pairwise import cosine_similarity
 except ImportError:
     # Note: The pip install commands below won't work in a regular Python script
     # You'll need to install these packages before running this script
@@ -28,12 +24,38 @@ except ImportError:
     subprocess.check_call(["pip", "install", "-q", "sentence-transformers"])
     import gradio as gr
     from together import Together
-    from sentence_transformers import SentenceTransformer
-    from sklearn.metrics.pairwise import cosine_similarity
+
+from lazy_imports import lazy_import
+
+# Loaded on first use: sentence_transformers (and torch) when a retriever is built, sklearn on the first search
+sentence_transformers = lazy_import("sentence_transformers")
+pairwise = lazy_import("sklearn.metrics.pairwise")
 
 # Get Client
 client = Together(api_key=API_KEY)
 
+# The reviewer answers in JSON so approval is read from a field instead of searching the text for "APPROVED"
+# (which also matched "NOT APPROVED")
+REVIEW_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "verdict": {"type": "string", "enum": ["APPROVED", "REVISE"]},
+        "feedback": {"type": "string"},
+    },
+    "required": ["verdict"],
+}
+
+
+def parse_review(review):
+    # Returns (approved, feedback for the next draft)
+    try:
+        parsed = parse_structured(review, REVIEW_SCHEMA)
+        return parsed["verdict"] == "APPROVED", parsed.get("feedback", "")
+    except StructuredOutputError:
+        # Free-text answer: only a leading verdict counts
+        first_word = review.strip().lstrip("*#>- ").split(maxsplit=1)
+        return bool(first_word) and first_word[0].strip(".:!,*").upper() == "APPROVED", review
+
 def prompt_llm(prompt, show_cost=False):
     # This function allows us to prompt an LLM via the Together API
 
@@ -67,6 +89,10 @@ def gen_image(prompt, width=256, height=256):
     image_url = response.data[0].url
     image_filename = "image.png"
 
+    # Only the image helper needs these, so they are imported on first use instead of at startup
+    import requests
+    from PIL import Image
+
     # Download the image using requests instead of wget
     response = requests.get(image_url)
     with open(image_filename, "wb") as f:
@@ -78,7 +104,7 @@ def gen_image(prompt, width=256, height=256):
 
 class EmailResponseRetriever:
     def __init__(self):
-        self.encoder = SentenceTransformer("all-MiniLM-L6-v2", use_auth_token=HGToken)
+        self.encoder = sentence_transformers.SentenceTransformer("all-MiniLM-L6-v2", use_auth_token=HGToken)
         # Sample email responses - in production, this would come from a database
         self.examples = {
             "medical_records": """
@@ -173,7 +199,7 @@ class EmailResponseRetriever:
     def get_relevant_example(self, query, top_k=2):
         query_embedding = self.encoder.encode(query)
         similarities = {
-            k: cosine_similarity([query_embedding], [emb])[0][0]
+            k: pairwise.cosine_similarity([query_embedding], [emb])[0][0]
             for k, emb in self.example_embeddings.items()
         }
         sorted_examples = sorted(similarities.items(), key=lambda x: x[1], reverse=True)
@@ -195,7 +221,7 @@ class EmailResponseRetriever:
 
 class PolicyRetriever:
     def __init__(self):
-        self.encoder = SentenceTransformer("all-MiniLM-L6-v2", use_auth_token=HGToken)
+        self.encoder = sentence_transformers.SentenceTransformer("all-MiniLM-L6-v2", use_auth_token=HGToken)
         # Sample medical policies - in production, this would come from a database
         self.policies = {
             "privacy": """
@@ -231,7 +257,7 @@ class PolicyRetriever:
     def get_relevant_policy(self, query, top_k=2):
         query_embedding = self.encoder.encode(query)
         similarities = {
-            k: cosine_similarity([query_embedding], [emb])[0][0]
+            k: pairwise.cosine_similarity([query_embedding], [emb])[0][0]
             for k, emb in self.policy_embeddings.items()
         }
         sorted_policies = sorted(similarities.items(), key=lambda x: x[1], reverse=True)
@@ -306,8 +332,8 @@ class EmailAgent:
             • Review completeness of response
             • Evaluate appropriate handling of sensitive information
             • Confirm all action items are clearly stated
-            • Limit response to 50 words maximum
-            • Show response only without additional commentary
+            • Answer with a JSON object only: {{"verdict": "APPROVED" or "REVISE", "feedback": "..."}}
+            • In feedback, list the specific changes needed (50 words maximum); leave it empty if approved
 
             CONTEXT (Relevant Policies):
             {policies}
@@ -356,13 +382,17 @@ class EmailAgent:
             Based on this analysis: {content}""",
         }
     
-    def process(self, content):
-        # Get relevant policies for the email content
+    def retrieve(self, content):
+        # Get relevant policies and examples for the email content
         relevant_policies = self.policy_retriever.get_relevant_policy(content)
-        # Get relevant examples for the email content
         relevant_examples = ""
         if self.example_retriever:
             relevant_examples = self.example_retriever.get_relevant_example(content)
+        return relevant_policies, relevant_examples
+
+    def process(self, content, context=None):
+        # context: (policies, examples) from an earlier retrieve(), so revisions don't search again
+        relevant_policies, relevant_examples = context or self.retrieve(content)
         
         # Add examples to the prompt if available
         if self.role in ["analyzer", "drafter", "casual_drafter", "example_justifier"]:
@@ -397,41 +427,49 @@ class EmailProcessingSystem:
 
     def process_email(self, email_content, use_casual_tone=False):
         max_attempts = 3
-        attempt = 1
 
-        while attempt <= max_attempts:
-            print(f"\nProcessing email - Attempt {attempt}")
+        # Everything upstream of the draft depends only on the email, so it runs once; a rejected draft
+        # only reruns the drafter and reviewer (2 calls per attempt instead of 6)
+        print("\nAnalyzing email content...")
+        analysis = self.analyzer.process(email_content)
 
-            # Step 1: Analyze email
-            print("\nAnalyzing email content...")
-            analysis = self.analyzer.process(email_content)
+        print("\nAnalyzing sentiment...")
+        sentiment = prompt_llm(
+            self.analyzer.prompts["sentiment"].format(content=email_content)
+        )
 
-            # Step 2: Analyze sentiment
-            print("\nAnalyzing sentiment...")
-            sentiment = prompt_llm(
-                self.analyzer.prompts["sentiment"].format(content=email_content)
-            )
+        # Get relevant policies and examples for display
+        relevant_policies = self.policy_retriever.get_relevant_policy(email_content)
+        relevant_examples = self.example_retriever.get_relevant_example(email_content)
 
-            # Step 3: Draft response - choose between casual or policy-based
-            print(f"\nDrafting response based on analysis... {'(Casual tone)' if use_casual_tone else '(Policy-based)'}")
-            if use_casual_tone:
-                draft = self.casual_drafter.process(analysis)
-            else:
-                draft = self.drafter.process(analysis)
+        # Add policy justification
+        policy_justification = self.policy_justifier.process(
+            f"Email: {email_content}\nPolicies: {relevant_policies}"
+        )
 
-            # Get relevant policies and examples for display
-            relevant_policies = self.policy_retriever.get_relevant_policy(email_content)
-            relevant_examples = self.example_retriever.get_relevant_example(email_content)
+        # Add example justification
+        example_justification = self.example_justifier.process(
+            f"Email: {email_content}\nExamples: {relevant_examples}"
+        )
 
-            # Add policy justification
-            policy_justification = self.policy_justifier.process(
-                f"Email: {email_content}\nPolicies: {relevant_policies}"
-            )
-            
-            # Add example justification
-            example_justification = self.example_justifier.process(
-                f"Email: {email_content}\nExamples: {relevant_examples}"
-            )
+        drafter = self.casual_drafter if use_casual_tone else self.drafter
+        # The drafter's own retrieval (keyed on the analysis) is the same for every attempt
+        draft_context = drafter.retrieve(analysis)
+        draft = None
+        feedback = None
+
+        for attempt in range(1, max_attempts + 1):
+            print(f"\nProcessing email - Attempt {attempt}")
+
+            print(f"\nDrafting response based on analysis... {'(Casual tone)' if use_casual_tone else '(Policy-based)'}")
+            if draft is None:
+                draft = drafter.process(analysis, context=draft_context)
+            else:
+                draft = drafter.process(
+                    f"{analysis}\n\nPREVIOUS DRAFT:\n{draft}\n\nREVISION FEEDBACK:\n{feedback}\n"
+                    "Rewrite the previous draft so it addresses this feedback.",
+                    context=draft_context,
+                )
 
             # Display formatted output
             print("\n" + "=" * 50)
@@ -440,7 +478,7 @@ class EmailProcessingSystem:
             print("\n" + "=" * 50)
             print("DRAFT RESPONSE:\n")
             print(draft)
-            
+
             if use_casual_tone:
                 print("\n" + "=" * 50)
                 print("EXAMPLE USED:\n")
@@ -456,7 +494,7 @@ class EmailProcessingSystem:
                 print("\n" + "=" * 50)
                 print("SIMILAR EMAIL EXAMPLES:\n")
                 print(relevant_examples)
-                
+
             print("\n" + "=" * 50)
 
             # Ask user for feedback on the draft
@@ -464,17 +502,19 @@ class EmailProcessingSystem:
             user_feedback = input().lower()
 
             if user_feedback != "y":
+                print("\nWhat should change? (press Enter to just try again)")
+                feedback = input().strip() or "The user was not satisfied with this draft; try a different approach."
                 print("\nMoving to next attempt...")
-                attempt += 1
                 continue
 
             # Step 4: Review response
             print("\nReviewing draft response...")
             review = self.reviewer.process(draft)
+            approved, feedback = parse_review(review)
             print("\nReview completed. Feedback:")
             print(review)
 
-            if "APPROVED" in review:
+            if approved:
                 return {
                     "status": "success",
                     "analysis": analysis,
@@ -484,13 +524,12 @@ class EmailProcessingSystem:
                     "relevant_examples": relevant_examples,
                     "policy_justification": policy_justification,
                     "example_justification": example_justification,
-                    "sentiment": sentiment
+                    "sentiment": sentiment,
+                    "attempts": attempt,
                 }
-            else:
-                print(f"\nRevision needed. Feedback: {review}")
-                attempt += 1
+            print(f"\nRevision needed. Feedback: {feedback}")
 
-        return {"status": "failed", "message": "Maximum revision attempts reached"}
+        return {"status": "failed", "message": "Maximum revision attempts reached", "last_draft": draft}
 
 def process_email(email_content):
     # Create policy retriever and example retriever
@@ -597,7 +636,7 @@ def main():
             # Get similarity scores for all examples
             query_embedding = retriever.encoder.encode(query)
             similarities = {
-                k: cosine_similarity([query_embedding], [emb])[0][0]
+                k: pairwise.cosine_similarity([query_embedding], [emb])[0][0]
                 for k, emb in retriever.example_embeddings.items()
             }
 
@@ -1,9 +1,18 @@
-from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import cosine_similarity
 import numpy as np
 import gradio as gr
 from ApiKey import API_KEY, HGToken
 from together import Together
+import uuid
+from feedback_store import get_feedback_store, output_id
+from embedding_cache import EmbeddingCache
+from lazy_imports import lazy_import
+
+# Loaded on first use: sentence_transformers (and torch) when a retriever is built, sklearn on the first search
+sentence_transformers = lazy_import("sentence_transformers")
+pairwise = lazy_import("sklearn.metrics.pairwise")
+
+# Corpus embeddings are cached on disk so restarts only encode new or changed entries
+embedding_cache = EmbeddingCache("all-MiniLM-L6-v2")
 
 
 # Function to interact with LLM using Together API
@@ -23,7 +32,7 @@ def prompt_llm(prompt, client=None):
 
 class EmailResponseRetriever:
     def __init__(self):
-        self.encoder = SentenceTransformer("all-MiniLM-L6-v2", use_auth_token=HGToken)
+        self.encoder = sentence_transformers.SentenceTransformer("all-MiniLM-L6-v2", use_auth_token=HGToken)
         # Sample email response examples with more casual tone
         self.examples = {
             "medical_records": """
@@ -73,15 +82,16 @@ class EmailResponseRetriever:
                 Need it sooner? Just let me know!
             """,
         }
-        # Pre-compute embeddings for examples
-        self.example_embeddings = {
-            k: self.encoder.encode(v) for k, v in self.examples.items()
-        }
+        # Pre-compute embeddings for examples (loaded from the on-disk cache when unchanged)
+        self.example_embeddings = dict(zip(
+            self.examples,
+            embedding_cache.load("examples", self.examples.values(), self.encoder.encode),
+        ))
 
     def get_relevant_response(self, query, top_k=2):
         query_embedding = self.encoder.encode(query)
         similarities = {
-            k: cosine_similarity([query_embedding], [emb])[0][0]
+            k: pairwise.cosine_similarity([query_embedding], [emb])[0][0]
             for k, emb in self.example_embeddings.items()
         }
         sorted_examples = sorted(similarities.items(), key=lambda x: x[1], reverse=True)
@@ -99,7 +109,7 @@ class EmailResponseRetriever:
 
 class PolicyRetriever:
     def __init__(self):
-        self.encoder = SentenceTransformer("all-MiniLM-L6-v2", use_auth_token=HGToken)
+        self.encoder = sentence_transformers.SentenceTransformer("all-MiniLM-L6-v2", use_auth_token=HGToken)
         # Sample medical policies - in production, this would come from a database
         self.policies = {
             "privacy": """
@@ -127,15 +137,16 @@ class PolicyRetriever:
                 - Generic alternatives offered when available
             """,
         }
-        # Pre-compute embeddings for policies
-        self.policy_embeddings = {
-            k: self.encoder.encode(v) for k, v in self.policies.items()
-        }
+        # Pre-compute embeddings for policies (loaded from the on-disk cache when unchanged)
+        self.policy_embeddings = dict(zip(
+            self.policies,
+            embedding_cache.load("policies", self.policies.values(), self.encoder.encode),
+        ))
 
     def get_relevant_policy(self, query, top_k=2):
         query_embedding = self.encoder.encode(query)
         similarities = {
-            k: cosine_similarity([query_embedding], [emb])[0][0]
+            k: pairwise.cosine_similarity([query_embedding], [emb])[0][0]
             for k, emb in self.policy_embeddings.items()
         }
         sorted_policies = sorted(similarities.items(), key=lambda x: x[1], reverse=True)
@@ -337,10 +348,12 @@ sample_emails = [
 def create_gradio_interface(client):
     state = {
         "current_index": 0,
-        "approved_count": 0,
-        "disapproved_count": 0,
         "results": {},
+        # The result the approve/disapprove buttons refer to
+        "last": None,
     }
+    # Approval counts live in the shared SQLite feedback store, so they survive restarts
+    feedback = get_feedback_store()
 
     email_system = EmailProcessingSystem(client)
 
@@ -348,6 +361,11 @@ def create_gradio_interface(client):
         email = sample_emails[email_index]
         result = email_system.process_email(email)
         state["results"][email] = result
+        state["last"] = {
+            "result_id": uuid.uuid4().hex,
+            "stage_ids": {name: output_id(value) for name, value in result.items() if name != "status"},
+        }
+        counts = feedback.stats()
 
         return (
             result["analysis"],
@@ -356,27 +374,33 @@ def create_gradio_interface(client):
             result["examples"],
             result["policy_justification"],
             result["example_justification"],
-            state["approved_count"],
-            state["disapproved_count"],
+            counts["approved_count"],
+            counts["disapproved_count"],
         )
 
     def update_email_display(index):
         return sample_emails[index]
 
+    def record_feedback(verdict):
+        # Queued and written in the background; returns the current totals
+        last = state["last"] or {}
+        feedback.record(verdict, result_id=last.get("result_id"), stage_ids=last.get("stage_ids"))
+        return feedback.stats()
+
     def approve_response():
-        state["approved_count"] += 1
+        counts = record_feedback("approved")
         return {
             approve_btn: gr.Button(interactive=False),
             disapprove_btn: gr.Button(interactive=False),
-            approved_count: state["approved_count"],
+            approved_count: counts["approved_count"],
         }
 
     def disapprove_response():
-        state["disapproved_count"] += 1
+        counts = record_feedback("disapproved")
         return {
             approve_btn: gr.Button(interactive=False),
             disapprove_btn: gr.Button(interactive=False),
-            disapproved_count: state["disapproved_count"],
+            disapproved_count: counts["disapproved_count"],
         }
 
     # Create the Gradio interface
@@ -417,10 +441,10 @@ def create_gradio_interface(client):
 
             with gr.Column():
                 approved_count = gr.Number(
-                    value=0, label="✅ Approved Emails", interactive=False
+                    value=lambda: feedback.stats()["approved_count"], label="✅ Approved Emails", interactive=False
                 )
                 disapproved_count = gr.Number(
-                    value=0, label="❌ Disapproved Emails", interactive=False
+                    value=lambda: feedback.stats()["disapproved_count"], label="❌ Disapproved Emails", interactive=False
                 )
 
         original_email = gr.Textbox(
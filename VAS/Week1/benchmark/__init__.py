@@ -0,0 +1,2 @@
+# Offline benchmarks for the email pipeline; run with `python -m benchmark.run` from VAS/Week1
+from benchmark.mock_llm_server import MockLLMConfig, MockLLMServer
@@ -0,0 +1,261 @@
+# Local stand-in for Together's OpenAI-compatible chat endpoint, so benchmarks cost no API credits
+# - Latency is drawn from a configurable distribution (fixed, uniform, normal, lognormal, exponential).
+# - A fraction of requests can fail with 500 or be throttled with 429 + Retry-After.
+# - Supports plain and streamed (server-sent events) chat completions and reports `usage` like the real API.
+# Usage: python -m benchmark.mock_llm_server --port 8799 --latency lognormal --latency-ms 400 --error-rate 0.01
+import argparse
+import json
+import math
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+LATENCY_DISTRIBUTIONS = ("fixed", "uniform", "normal", "lognormal", "exponential")
+
+
+class MockLLMConfig:
+    def __init__(self, latency="lognormal", latency_ms=300.0, jitter=0.5, token_ms=5.0, completion_tokens=40,
+                 error_rate=0.0, throttle_rate=0.0, retry_after=0.1, seed=0):
+        # latency_ms is the median (mean for normal/exponential); jitter is the spread:
+        # sigma for lognormal, a fraction of latency_ms for uniform/normal
+        if latency not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(f"Unknown latency distribution {latency!r}, expected one of {LATENCY_DISTRIBUTIONS}")
+        self.latency = latency
+        self.latency_ms = latency_ms
+        self.jitter = jitter
+        self.token_ms = token_ms
+        self.completion_tokens = completion_tokens
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.seed = seed
+
+    def to_dict(self):
+        return dict(vars(self))
+
+
+class _QuietServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients closing pooled keep-alive connections is normal at the end of a run
+        if not isinstance(sys.exc_info()[1], (ConnectionResetError, BrokenPipeError)):
+            super().handle_error(request, client_address)
+
+
+class MockLLMServer:
+    def __init__(self, config=None, host="127.0.0.1", port=0):
+        self.config = config or MockLLMConfig()
+        self._random = random.Random(self.config.seed)
+        self._lock = threading.Lock()
+        self.counts = {"requests": 0, "streams": 0, "errors": 0, "throttled": 0}
+        handler = type("Handler", (_Handler,), {"server_state": self})
+        self.httpd = _QuietServer((host, port), handler)
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True, name="mock-llm")
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def sample_latency(self):
+        c = self.config
+        with self._lock:
+            if c.latency == "fixed":
+                ms = c.latency_ms
+            elif c.latency == "uniform":
+                ms = self._random.uniform(c.latency_ms * (1 - c.jitter), c.latency_ms * (1 + c.jitter))
+            elif c.latency == "normal":
+                ms = self._random.gauss(c.latency_ms, c.latency_ms * c.jitter)
+            elif c.latency == "lognormal":
+                ms = self._random.lognormvariate(math.log(c.latency_ms), c.jitter)
+            else:
+                ms = self._random.expovariate(1.0 / c.latency_ms)
+        return max(ms, 0.0) / 1000.0
+
+    def outcome(self):
+        # Returns "error", "throttled" or "ok" for the next request and counts it
+        with self._lock:
+            self.counts["requests"] += 1
+            roll = self._random.random()
+            if roll < self.config.throttle_rate:
+                self.counts["throttled"] += 1
+                return "throttled"
+            if roll < self.config.throttle_rate + self.config.error_rate:
+                self.counts["errors"] += 1
+                return "error"
+            return "ok"
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counts)
+
+
+def _reply_words(prompt, count):
+    # Deterministic filler so responses differ per prompt but never depend on timing
+    if "Evaluate this draft" in prompt:
+        words = ["APPROVED.", "The", "draft", "is", "clear", "and", "compliant."]
+    else:
+        words = ["Thanks", "for", "reaching", "out,", "we", "will", "follow", "up", "shortly."]
+    offset = len(prompt) % len(words)
+    return [words[(offset + i) % len(words)] for i in range(count)]
+
+
+def _json_reply(schema, words):
+    # JSON mode: one object filling every schema property (first enum value, or filler text)
+    properties = (schema or {}).get("properties", {"text": {"type": "string"}})
+    reply = {}
+    for name, spec in properties.items():
+        reply[name] = spec["enum"][0] if "enum" in spec else " ".join(words)
+    return json.dumps(reply)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in separate writes; with Nagle on, every keep-alive call would wait ~40 ms
+    # for the client's delayed ACK and the benchmark would measure that instead of the pipeline
+    disable_nagle_algorithm = True
+    server_state = None
+
+    def log_message(self, *args):
+        pass
+
+    def _send_json(self, payload, status=200, headers=None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_chunk(self, data):
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def do_GET(self):
+        # LLMClient.warmup() touches /models to open connections
+        if self.path.rstrip("/").endswith("/models"):
+            self._send_json({"object": "list", "data": [{"id": "mock", "object": "model"}]})
+        else:
+            self._send_json({"error": {"message": "Not found"}}, 404)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json({"error": {"message": "Not found"}}, 404)
+            return
+
+        state = self.server_state
+        config = state.config
+        time.sleep(state.sample_latency())
+        outcome = state.outcome()
+        if outcome == "throttled":
+            self._send_json({"error": {"message": "Rate limited"}}, 429, {"Retry-After": str(config.retry_after)})
+            return
+        if outcome == "error":
+            self._send_json({"error": {"message": "Mock server error"}}, 500)
+            return
+
+        prompt = "".join(m.get("content", "") for m in body.get("messages", []))
+        completion_tokens = min(config.completion_tokens, body.get("max_tokens") or config.completion_tokens)
+        words = _reply_words(prompt, completion_tokens)
+        completion_tokens = len(words)
+        if (body.get("response_format") or {}).get("type") == "json_object":
+            words = [_json_reply(body["response_format"].get("schema"), words)]
+        usage = {
+            "prompt_tokens": len(prompt) // 4 + 1,
+            "completion_tokens": completion_tokens,
+            "total_tokens": len(prompt) // 4 + 1 + completion_tokens,
+        }
+        if body.get("stream"):
+            self._stream(body.get("model"), words, usage, config.token_ms / 1000.0)
+        else:
+            self._send_json({
+                "id": "mock",
+                "object": "chat.completion",
+                "model": body.get("model"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": " ".join(words)},
+                             "finish_reason": "stop"}],
+                "usage": usage,
+            })
+
+    def _stream(self, model, words, usage, token_delay):
+        with self.server_state._lock:
+            self.server_state.counts["streams"] += 1
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for i, word in enumerate(words):
+            if token_delay:
+                time.sleep(token_delay)
+            chunk = {"model": model, "choices": [{"index": 0, "delta": {"content": word if i == 0 else " " + word}}]}
+            self._send_chunk(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+        # Like Together, the last chunk carries the usage block
+        self._send_chunk(f"data: {json.dumps({'choices': [], 'usage': usage})}\n\n".encode("utf-8"))
+        self._send_chunk(b"data: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+
+def add_server_arguments(parser):
+    parser.add_argument("--latency", choices=LATENCY_DISTRIBUTIONS, default="lognormal", help="Latency distribution")
+    parser.add_argument("--latency-ms", type=float, default=300.0, help="Median (or mean) response latency")
+    parser.add_argument("--jitter", type=float, default=0.5, help="Latency spread (lognormal sigma, or fraction)")
+    parser.add_argument("--token-ms", type=float, default=5.0, help="Delay between streamed tokens")
+    parser.add_argument("--completion-tokens", type=int, default=40, help="Tokens per response (capped by max_tokens)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with 500")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Fraction of requests answered with 429")
+    parser.add_argument("--retry-after", type=float, default=0.1, help="Retry-After seconds sent with 429s")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for latency and error sampling")
+
+
+def config_from_args(args):
+    return MockLLMConfig(
+        latency=args.latency,
+        latency_ms=args.latency_ms,
+        jitter=args.jitter,
+        token_ms=args.token_ms,
+        completion_tokens=args.completion_tokens,
+        error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate,
+        retry_after=args.retry_after,
+        seed=args.seed,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a mock OpenAI-compatible chat server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8799)
+    add_server_arguments(parser)
+    args = parser.parse_args()
+
+    server = MockLLMServer(config_from_args(args), args.host, args.port)
+    print(f"Mock LLM server on {server.base_url} (set LLM_BASE_URL to this)")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(f"Served: {server.stats()}")
@@ -0,0 +1,318 @@
+# Offline benchmarks for the email pipeline
+# - Starts a local mock LLM server (see mock_llm_server.py) and points the shared LLM client at it,
+#   so runs are free, repeatable and independent of the provider's latency on the day.
+# - Fixed workloads: one email at a time, a batch of 1k emails, a concurrent mix of full/streamed
+#   pipelines and retrieval-only requests, and retriever search on its own.
+# - Reports p50/p95/p99 latency, throughput, error rates and memory, and writes everything to a JSON file
+#   that a later run can be compared against with --compare.
+# Usage (from VAS/Week1): python -m benchmark.run --workloads single,batch --compare benchmark/results/old.json
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from benchmark.mock_llm_server import MockLLMServer, add_server_arguments, config_from_args
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+WORKLOADS = ("single", "batch", "concurrent", "retrieval")
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+# Share of each request type in the concurrent mix
+CONCURRENT_MIX = {"process": 0.5, "process_stream": 0.2, "retrieval": 0.3}
+
+
+def configure_environment(server, llm_cache=False):
+    # Must run before EmailProcessor10 / llm_client are imported, since they read these at import time
+    os.environ["LLM_BASE_URL"] = server.base_url
+    # The mock server has no quota, so client-side request/token buckets would only measure themselves
+    os.environ.setdefault("LLM_RPM", "0")
+    os.environ.setdefault("LLM_TPM", "0")
+    if not llm_cache:
+        # Every call reaches the server; repeated workload emails would otherwise be answered from memory
+        os.environ["LLM_CACHE_SIZE"] = "0"
+        os.environ.pop("LLM_CACHE_SQLITE", None)
+
+
+def make_emails(count, seed=0):
+    # Distinct emails built from the app's samples, so neither cache can answer a repeat
+    from EmailProcessor10 import sample_emails
+
+    rng = random.Random(seed)
+    return [f"{rng.choice(sample_emails)}\n(Reference #{i})" for i in range(count)]
+
+
+def memory_snapshot():
+    snapshot = {"rss_mb": None, "peak_rss_mb": None}
+    try:
+        with open("/proc/self/statm") as f:
+            snapshot["rss_mb"] = round(int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20, 1)
+    except (OSError, ValueError, AttributeError):
+        pass
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is KiB on Linux and bytes on macOS
+        snapshot["peak_rss_mb"] = round(peak / (2 ** 20 if sys.platform == "darwin" else 2 ** 10), 1)
+    return snapshot
+
+
+def summarize(latencies, errors, seconds):
+    count = len(latencies) + sum(errors.values())
+    summary = {
+        "requests": count,
+        "errors": sum(errors.values()),
+        "error_rate": round(sum(errors.values()) / count, 4) if count else 0.0,
+        "error_types": dict(errors),
+        "seconds": round(seconds, 3),
+        "throughput_per_s": round(len(latencies) / seconds, 3) if seconds > 0 else 0.0,
+    }
+    if latencies:
+        ms = np.asarray(latencies) * 1000.0
+        p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+        summary["latency_ms"] = {
+            "min": round(float(ms.min()), 2),
+            "mean": round(float(ms.mean()), 2),
+            "p50": round(float(p50), 2),
+            "p95": round(float(p95), 2),
+            "p99": round(float(p99), 2),
+            "max": round(float(ms.max()), 2),
+        }
+    return summary
+
+
+class Recorder:
+    # Collects per-request latencies and error types from many threads, optionally per request type
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = {}
+        self.errors = {}
+
+    def call(self, kind, func, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            func(*args, **kwargs)
+        except Exception as e:
+            with self._lock:
+                self.errors.setdefault(kind, Counter())[type(e).__name__] += 1
+            return
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.latencies.setdefault(kind, []).append(elapsed)
+
+    def summary(self, seconds):
+        kinds = sorted(set(self.latencies) | set(self.errors))
+        all_latencies = [x for kind in kinds for x in self.latencies.get(kind, [])]
+        all_errors = sum((self.errors.get(kind, Counter()) for kind in kinds), Counter())
+        summary = summarize(all_latencies, all_errors, seconds)
+        if len(kinds) > 1:
+            summary["by_type"] = {
+                kind: summarize(self.latencies.get(kind, []), self.errors.get(kind, Counter()), seconds)
+                for kind in kinds
+            }
+        return summary
+
+
+def run_single(app, args):
+    # Sequential emails: per-email latency with no contention
+    system = app.get_email_system()
+    recorder = Recorder()
+    start = time.perf_counter()
+    for email in make_emails(args.single_repeats, args.seed):
+        recorder.call("process", system.process_email, email)
+    return recorder.summary(time.perf_counter() - start)
+
+
+def run_batch(app, args):
+    # A 1k-email backlog through a bulk-sized system (see bulk_process.py), `workers` emails at a time
+    from bulk_process import build_bulk_system
+
+    system = build_bulk_system(args.workers)
+    recorder = Recorder()
+    emails = make_emails(args.batch_size, args.seed + 1)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.workers, thread_name_prefix="bench") as pool:
+        list(pool.map(lambda email: recorder.call("process", system.process_email, email), emails))
+    return recorder.summary(time.perf_counter() - start)
+
+
+def run_concurrent(app, args):
+    # Mixed traffic from `concurrency` simulated users against the shared, app-wide system
+    system = app.get_email_system()
+    response_retriever, policy_retriever = app.get_shared_retrievers()
+    rng = random.Random(args.seed + 2)
+    kinds = rng.choices(list(CONCURRENT_MIX), weights=list(CONCURRENT_MIX.values()), k=args.concurrent_requests)
+    emails = make_emails(args.concurrent_requests, args.seed + 2)
+
+    def retrieve(email):
+        policy_retriever.get_relevant_policy(email)
+        response_retriever.get_relevant_response(email)
+
+    operations = {
+        "process": system.process_email,
+        "process_stream": lambda email: system.process_email(email, on_stage=lambda *_: None, on_token=lambda _: None),
+        "retrieval": retrieve,
+    }
+    recorder = Recorder()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency, thread_name_prefix="bench") as pool:
+        list(pool.map(lambda pair: recorder.call(pair[0], operations[pair[0]], pair[1]), zip(kinds, emails)))
+    return recorder.summary(time.perf_counter() - start)
+
+
+def run_retrieval(app, args):
+    # Retriever cost on its own: single-query search and one batched search over the same queries
+    response_retriever, policy_retriever = app.get_shared_retrievers()
+    queries = make_emails(args.retrieval_queries, args.seed + 3)
+    recorder = Recorder()
+    start = time.perf_counter()
+    for query in queries:
+        recorder.call("search", policy_retriever.search, query)
+    seconds = time.perf_counter() - start
+    summary = recorder.summary(seconds)
+
+    start = time.perf_counter()
+    policy_retriever.search_batch(queries)
+    batch_seconds = time.perf_counter() - start
+    summary["search_batch"] = {
+        "queries": len(queries),
+        "seconds": round(batch_seconds, 4),
+        "throughput_per_s": round(len(queries) / batch_seconds, 1) if batch_seconds > 0 else 0.0,
+    }
+    summary["corpus_size"] = {"examples": len(response_retriever.documents), "policies": len(policy_retriever.documents)}
+    return summary
+
+
+RUNNERS = {"single": run_single, "batch": run_batch, "concurrent": run_concurrent, "retrieval": run_retrieval}
+
+
+def run_workload(name, app, server, args):
+    limiter = app.get_llm_client().limiter
+    server_before = server.stats()
+    retries_before = limiter.retries
+    if args.tracemalloc:
+        tracemalloc.reset_peak()
+    memory_before = memory_snapshot()
+
+    print(f"Running {name}...", file=sys.stderr, flush=True)
+    summary = RUNNERS[name](app, args)
+
+    server_after = server.stats()
+    summary["llm_server"] = {key: server_after[key] - server_before[key] for key in server_after}
+    summary["llm_client_retries"] = limiter.retries - retries_before
+    summary["memory"] = {"before": memory_before, "after": memory_snapshot()}
+    if args.tracemalloc:
+        summary["memory"]["python_heap_peak_mb"] = round(tracemalloc.get_traced_memory()[1] / 2 ** 20, 1)
+    return summary
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current, previous_path):
+    # Prints latency and throughput changes for every workload both runs have
+    with open(previous_path, "r", encoding="utf-8") as f:
+        previous = json.load(f)
+    print(f"\nCompared with {previous_path} ({previous.get('git_commit')}, {previous.get('started')}):")
+    for name, result in current["workloads"].items():
+        before = previous.get("workloads", {}).get(name)
+        if not before:
+            continue
+        print(f"  {name}:")
+        rows = [(k, before.get("latency_ms", {}).get(k), result.get("latency_ms", {}).get(k)) for k in ("p50", "p95", "p99")]
+        rows.append(("throughput_per_s", before.get("throughput_per_s"), result.get("throughput_per_s")))
+        rows.append(("error_rate", before.get("error_rate"), result.get("error_rate")))
+        for key, old, new in rows:
+            if old is None or new is None:
+                continue
+            change = f"{(new - old) / old * 100:+.1f}%" if old else "n/a"
+            print(f"    {key:<18} {old:>10} -> {new:<10} ({change})")
+
+
+def print_summary(results):
+    for name, result in results["workloads"].items():
+        latency = result.get("latency_ms", {})
+        print(
+            f"{name:<11} {result['requests']:>5} req  {result['throughput_per_s']:>8.2f}/s  "
+            f"p50 {latency.get('p50', '-')}ms  p95 {latency.get('p95', '-')}ms  p99 {latency.get('p99', '-')}ms  "
+            f"errors {result['error_rate']:.2%}  rss {result['memory']['after']['rss_mb']}MB"
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the email pipeline against a local mock LLM server")
+    parser.add_argument("--workloads", default=",".join(WORKLOADS), help=f"Comma-separated subset of {WORKLOADS}")
+    parser.add_argument("--single-repeats", type=int, default=20, help="Emails in the single workload")
+    parser.add_argument("--batch-size", type=int, default=1000, help="Emails in the batch workload")
+    parser.add_argument("--workers", type=int, default=8, help="Emails in flight in the batch workload")
+    parser.add_argument("--concurrent-requests", type=int, default=200, help="Requests in the concurrent mix")
+    parser.add_argument("--concurrency", type=int, default=16, help="Simulated users in the concurrent mix")
+    parser.add_argument("--retrieval-queries", type=int, default=1000, help="Queries in the retrieval workload")
+    parser.add_argument("--llm-cache", action="store_true", help="Keep the LLM response cache enabled")
+    parser.add_argument("--tracemalloc", action="store_true", help="Also report the Python heap peak (slower)")
+    parser.add_argument("--output", help="Results file (default benchmark/results/<timestamp>.json)")
+    parser.add_argument("--compare", help="Earlier results file to compare against")
+    add_server_arguments(parser)
+    args = parser.parse_args(argv)
+
+    workloads = [w.strip() for w in args.workloads.split(",") if w.strip()]
+    unknown = [w for w in workloads if w not in RUNNERS]
+    if unknown:
+        parser.error(f"Unknown workloads {unknown}, expected some of {WORKLOADS}")
+
+    with MockLLMServer(config_from_args(args)) as server:
+        configure_environment(server, args.llm_cache)
+        import EmailProcessor10 as app
+
+        if args.tracemalloc:
+            tracemalloc.start()
+        setup_start = time.perf_counter()
+        app.warmup()
+        results = {
+            "started": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "git_commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "args": {k: v for k, v in vars(args).items() if k not in ("output", "compare")},
+            "mock_server": server.config.to_dict(),
+            "warmup_seconds": round(time.perf_counter() - setup_start, 3),
+            "workloads": {},
+        }
+        for name in workloads:
+            results["workloads"][name] = run_workload(name, app, server, args)
+        if args.tracemalloc:
+            tracemalloc.stop()
+
+    output = args.output or os.path.join(RESULTS_DIR, time.strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+
+    print_summary(results)
+    print(f"Results written to {output}")
+    if args.compare:
+        compare(results, args.compare)
+    return results
+
+
+if __name__ == "__main__":
+    main()
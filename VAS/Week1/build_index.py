@@ -0,0 +1,95 @@
+# Offline index builder for large policy / example corpora
+# - Reads a JSON file of {name: text}, encodes it in batches with the shared MiniLM model and saves an index
+#   directory (index.json + backend files + documents.json) that the retrievers load at startup.
+# - --recall-queries N prints the index's memory use and its recall@k against exact search on N corpus rows.
+# Usage: python build_index.py policies.json indexes/policies --backend ivf --nlist 1024 --nprobe 16
+#        python build_index.py policies.json indexes/policies --backend quantized --dtype int8 --recall-queries 500
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+from model_registry import registry, DEFAULT_MODEL
+from vector_index import (
+    INDEX_BACKENDS, QUANTIZED_DTYPES, DenseIndex, build_index, load_index, memory_report, recall_at_k
+)
+
+
+def encode_corpus(texts, model_name=DEFAULT_MODEL, batch_size=256):
+    encoder = registry.get(model_name)
+    return encoder.encode(texts, batch_size=batch_size, normalize_embeddings=True, show_progress_bar=True)
+
+
+def build_and_save(documents, directory, backend="exact", model_name=DEFAULT_MODEL, recall_queries=0, top_k=10,
+                   **params):
+    keys = list(documents)
+    start = time.perf_counter()
+    embeddings = encode_corpus([documents[k] for k in keys], model_name)
+    encoded_at = time.perf_counter()
+    index = build_index(backend, keys, embeddings, **params)
+    built_at = time.perf_counter()
+
+    index.save(directory)
+    with open(os.path.join(directory, "documents.json"), "w", encoding="utf-8") as f:
+        json.dump(documents, f)
+    print(
+        f"Indexed {len(keys)} documents with {backend}: "
+        f"encode {encoded_at - start:.1f}s, build {built_at - encoded_at:.1f}s -> {directory}"
+    )
+    if recall_queries:
+        # Check the index as the retrievers will see it: loaded back, with memory-mapped parts left on disk
+        check_index(load_index(directory), keys, embeddings, recall_queries, top_k)
+    return index
+
+
+def check_index(index, keys, embeddings, queries=500, top_k=10, seed=0):
+    # Memory use next to an exact float32 index, and recall@k against it on a sample of corpus rows
+    exact = DenseIndex(keys, embeddings)
+    for name, candidate in (("exact", exact), (index.backend, index)):
+        report = memory_report(candidate)
+        print(
+            f"{name}: {report['resident_bytes'] / 2 ** 20:.1f} MiB resident, "
+            f"{report['mapped_bytes'] / 2 ** 20:.1f} MiB memory-mapped"
+        )
+    rng = np.random.default_rng(seed)
+    sample = np.asarray(embeddings)[rng.choice(len(keys), min(queries, len(keys)), replace=False)]
+    start = time.perf_counter()
+    recall = recall_at_k(index, exact, sample, top_k)
+    print(f"recall@{top_k} vs exact on {len(sample)} queries: {recall:.4f} ({time.perf_counter() - start:.1f}s)")
+    return recall
+
+
+def load_documents(directory):
+    with open(os.path.join(directory, "documents.json"), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build a retriever index offline")
+    parser.add_argument("corpus", help="JSON file mapping document name to text")
+    parser.add_argument("output", help="Directory to write the index to")
+    parser.add_argument("--backend", choices=sorted(INDEX_BACKENDS), default="exact")
+    parser.add_argument("--nlist", type=int, help="Number of IVF lists (ivf, faiss)")
+    parser.add_argument("--nprobe", type=int, help="Lists scanned per query (ivf, faiss)")
+    parser.add_argument("--M", type=int, help="Graph degree (hnswlib)")
+    parser.add_argument("--ef-construction", type=int, dest="ef_construction", help="Build-time beam (hnswlib)")
+    parser.add_argument("--ef", type=int, help="Query-time beam (hnswlib)")
+    parser.add_argument("--dtype", choices=QUANTIZED_DTYPES, help="Stored vector type (quantized)")
+    parser.add_argument("--no-rescore", action="store_false", dest="rescore", default=None,
+                        help="Skip float32 rescoring of candidates (quantized)")
+    parser.add_argument("--rescore-factor", type=int, dest="rescore_factor", help="Candidates rescored per result (quantized)")
+    parser.add_argument("--recall-queries", type=int, default=0, help="Report memory and recall@k on N corpus rows")
+    parser.add_argument("--top-k", type=int, default=10, help="k for the recall check")
+    args = parser.parse_args()
+
+    with open(args.corpus, "r", encoding="utf-8") as f:
+        corpus = json.load(f)
+    params = {
+        name: value
+        for name, value in vars(args).items()
+        if name in ("nlist", "nprobe", "M", "ef_construction", "ef", "dtype", "rescore", "rescore_factor")
+        and value is not None
+    }
+    build_and_save(corpus, args.output, args.backend, recall_queries=args.recall_queries, top_k=args.top_k, **params)
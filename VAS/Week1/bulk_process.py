@@ -0,0 +1,145 @@
+# Non-interactive bulk processing for overnight email backlogs
+# - One EmailProcessingSystem is reused for the whole run; emails are processed by a configurable number of
+#   workers with a bounded number in flight, so memory stays flat however long the input is.
+# - Each result is appended to a JSONL file as soon as it finishes, and throughput / ETA are printed as we go.
+# Usage: python bulk_process.py emails.jsonl results.jsonl --workers 8 --max-in-flight 32
+import argparse
+import json
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from ApiKey import API_KEY
+from llm_client import LLMClient
+from EmailProcessor10 import EmailProcessingSystem, sample_emails
+
+# Stages that can run at once for a single email (context, analysis, sentiment, both justifiers)
+PARALLEL_STAGES_PER_EMAIL = 4
+
+
+class InvalidRecord(ValueError):
+    # Stands in for the email text of an input line that couldn't be read; reported as a failed result
+    pass
+
+
+def read_emails(path):
+    # JSONL with an "email" field per line (plain strings are accepted too); yields (id, text) lazily.
+    # A malformed line yields (line number, InvalidRecord) so one bad line doesn't end the run.
+    with open(path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                yield line_number, InvalidRecord(f"line {line_number} is not valid JSON: {e}")
+                continue
+            if isinstance(record, str):
+                yield line_number, record
+            elif isinstance(record, dict) and isinstance(record.get("email"), str):
+                yield record.get("id", line_number), record["email"]
+            else:
+                yield line_number, InvalidRecord(f'line {line_number} has no "email" string')
+
+
+def _process_one(system, email_id, email):
+    start = time.perf_counter()
+    if isinstance(email, InvalidRecord):
+        result = {"status": "error", "message": f"Invalid input: {email}"}
+        email = None
+    else:
+        try:
+            result = system.process_email(email)
+        except Exception as e:
+            result = {"status": "error", "message": f"Error processing email: {str(e)}"}
+    result["id"] = email_id
+    result["email"] = email
+    result["seconds"] = round(time.perf_counter() - start, 3)
+    return result
+
+
+class ProgressReporter:
+    def __init__(self, total=None, every=10, stream=sys.stderr):
+        self.total = total
+        self.every = every
+        self.stream = stream
+        self.start = time.perf_counter()
+        self.done = 0
+        self.errors = 0
+
+    def update(self, result):
+        self.done += 1
+        if result.get("status") != "success":
+            self.errors += 1
+        if self.done % self.every == 0 or self.done == self.total:
+            print(self.line(), file=self.stream, flush=True)
+
+    def line(self):
+        elapsed = time.perf_counter() - self.start
+        rate = self.done / elapsed if elapsed > 0 else 0.0
+        line = f"{self.done}"
+        if self.total:
+            line += f"/{self.total}"
+        line += f" emails, {self.errors} errors, {rate:.2f} emails/s"
+        if self.total and rate > 0:
+            line += f", ETA {(self.total - self.done) / rate:.0f}s"
+        return line
+
+
+def process_emails_bulk(emails, system, output, workers=8, max_in_flight=None, total=None, progress_every=10):
+    """Process (id, email) pairs with `workers` threads, writing JSONL results to `output` as they finish."""
+    max_in_flight = max(max_in_flight or workers * 2, workers)
+    progress = ProgressReporter(total, progress_every)
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bulk") as pool:
+        in_flight = set()
+        for email_id, email in emails:
+            # Bounded queue: wait for a slot before reading the next email
+            if len(in_flight) >= max_in_flight:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                _write_results(done, output, progress)
+            in_flight.add(pool.submit(_process_one, system, email_id, email))
+        done, _ = wait(in_flight)
+        _write_results(done, output, progress)
+
+    print(f"Finished: {progress.line()}", file=progress.stream, flush=True)
+    return progress
+
+
+def _write_results(futures, output, progress):
+    for future in futures:
+        result = future.result()
+        output.write(json.dumps(result) + "\n")
+        progress.update(result)
+    output.flush()
+
+
+def build_bulk_system(workers):
+    # Size the stage pool and LLM connection pool for `workers` emails in flight at once
+    concurrency = workers * PARALLEL_STAGES_PER_EMAIL
+    client = LLMClient(API_KEY, pool_size=concurrency)
+    executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="stage")
+    return EmailProcessingSystem(client, executor=executor)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Process a backlog of emails without user interaction")
+    parser.add_argument("input", nargs="?", help="JSONL file of emails (defaults to the sample emails)")
+    parser.add_argument("output", nargs="?", default="results.jsonl", help="JSONL file to append results to")
+    parser.add_argument("--workers", type=int, default=8, help="Emails processed concurrently")
+    parser.add_argument("--max-in-flight", type=int, help="Emails submitted but not yet written (default 2x workers)")
+    parser.add_argument("--progress-every", type=int, default=10, help="Print progress every N emails")
+    args = parser.parse_args()
+
+    if args.input:
+        with open(args.input, "r", encoding="utf-8") as f:
+            total = sum(1 for line in f if line.strip())
+        emails = read_emails(args.input)
+    else:
+        total = len(sample_emails)
+        emails = enumerate(sample_emails)
+
+    system = build_bulk_system(args.workers)
+    with open(args.output, "a", encoding="utf-8") as output:
+        process_emails_bulk(emails, system, output, args.workers, args.max_in_flight, total, args.progress_every)
@@ -0,0 +1,117 @@
+# Persistent embedding cache for the retriever corpora
+# - Embeddings are content-addressed: a row is keyed by the model name and a SHA-256 of the text.
+# - Each corpus is stored as a normalized float32 .npy file plus a small JSON manifest, and is opened
+#   with mmap_mode="r" so several worker processes share the same pages instead of holding their own copy.
+# - On startup only texts that are new or changed get encoded; everything else is reused from disk.
+import hashlib
+import json
+import os
+import re
+
+import numpy as np
+
+from vector_index import normalize_rows
+
+DEFAULT_CACHE_DIR = os.environ.get(
+    "EMBEDDING_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".embedding_cache"),
+)
+
+
+def text_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _atomic_write_bytes(path, write):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        write(f)
+    os.replace(tmp_path, path)
+
+
+class EmbeddingCache:
+    def __init__(self, model_name, cache_dir=DEFAULT_CACHE_DIR):
+        self.model_name = model_name
+        self.directory = os.path.join(cache_dir, re.sub(r"[^A-Za-z0-9_.-]", "_", model_name))
+        self.manifest_path = os.path.join(self.directory, "manifest.json")
+        self.hits = 0
+        self.misses = 0
+
+    def _read_manifest(self):
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return {"model": self.model_name, "corpora": {}}
+        if manifest.get("model") != self.model_name:
+            return {"model": self.model_name, "corpora": {}}
+        return manifest
+
+    def _open(self, file_name):
+        return np.load(os.path.join(self.directory, file_name), mmap_mode="r")
+
+    def _known_rows(self, manifest):
+        # hash -> (file, row) for every corpus already on disk, so texts shared between corpora are reused too
+        known = {}
+        for entry in manifest["corpora"].values():
+            if not os.path.exists(os.path.join(self.directory, entry["file"])):
+                continue
+            for row, h in enumerate(entry["hashes"]):
+                known.setdefault(h, (entry["file"], row))
+        return known
+
+    def load(self, corpus_name, texts, encode):
+        """Return a read-only (len(texts), dim) matrix of normalized embeddings, encoding only what is missing."""
+        texts = list(texts)
+        hashes = [text_hash(t) for t in texts]
+        digest = hashlib.sha256("".join(hashes).encode("ascii")).hexdigest()[:16]
+        file_name = f"{re.sub(r'[^A-Za-z0-9_.-]', '_', corpus_name)}-{digest}.npy"
+
+        manifest = self._read_manifest()
+        entry = manifest["corpora"].get(corpus_name)
+        if entry and entry["file"] == file_name and os.path.exists(os.path.join(self.directory, file_name)):
+            self.hits += len(texts)
+            return self._open(file_name)
+
+        # Reuse whatever rows already exist on disk and encode the rest in one call
+        known = self._known_rows(manifest)
+        missing = [i for i, h in enumerate(hashes) if h not in known]
+        encoded = normalize_rows(encode([texts[i] for i in missing])) if missing else None
+
+        opened = {}
+        rows = []
+        missing_position = {i: n for n, i in enumerate(missing)}
+        for i, h in enumerate(hashes):
+            if i in missing_position:
+                rows.append(encoded[missing_position[i]])
+            else:
+                source_file, row = known[h]
+                if source_file not in opened:
+                    opened[source_file] = self._open(source_file)
+                rows.append(np.asarray(opened[source_file][row], dtype=np.float32))
+        matrix = np.vstack(rows).astype(np.float32) if rows else np.zeros((0, 0), dtype=np.float32)
+        self.hits += len(texts) - len(missing)
+        self.misses += len(missing)
+
+        os.makedirs(self.directory, exist_ok=True)
+        _atomic_write_bytes(os.path.join(self.directory, file_name), lambda f: np.save(f, matrix))
+
+        # Re-read the manifest right before writing so corpora saved by other processes are kept
+        manifest = self._read_manifest()
+        previous = manifest["corpora"].get(corpus_name)
+        manifest["corpora"][corpus_name] = {"file": file_name, "hashes": hashes, "dim": int(matrix.shape[1])}
+        _atomic_write_bytes(
+            self.manifest_path,
+            lambda f: f.write(json.dumps(manifest, indent=2).encode("utf-8")),
+        )
+        if previous and previous["file"] != file_name:
+            # Already-mapped copies stay valid after unlink on POSIX
+            try:
+                os.remove(os.path.join(self.directory, previous["file"]))
+            except OSError:
+                pass
+
+        return self._open(file_name)
+
+    def stats(self):
+        return {"directory": self.directory, "hits": self.hits, "misses": self.misses}
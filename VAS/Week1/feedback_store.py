@@ -0,0 +1,226 @@
+# Server-side approve/disapprove feedback
+# - One SQLite file (WAL mode) shared by every worker process and kept across restarts, instead of
+#   counters in the browser's cookie session or in one process's memory.
+# - record() only puts the event on a queue; a writer thread commits whatever has queued up as one
+#   transaction (event rows plus one atomic increment per verdict), so a click never waits on disk.
+# - Each event keeps the result ID and the IDs of the stage outputs it judged, so feedback can be traced
+#   back to the exact analysis/draft/review that was shown.
+# - stats() is served from a cached aggregate, refreshed at most every FEEDBACK_STATS_TTL seconds, plus
+#   this process's not-yet-written events so a user sees their own click straight away.
+import atexit
+import hashlib
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+FEEDBACK_DB = os.environ.get("FEEDBACK_DB", "feedback.db")
+FEEDBACK_FLUSH_MS = float(os.environ.get("FEEDBACK_FLUSH_MS", "50"))
+FEEDBACK_STATS_TTL = float(os.environ.get("FEEDBACK_STATS_TTL", "1.0"))
+FEEDBACK_QUEUE_SIZE = 10000
+# Client-supplied IDs are stored as-is, so their number and size are capped
+MAX_STAGE_IDS = 16
+MAX_ID_LENGTH = 64
+
+VERDICTS = ("approved", "disapproved")
+
+
+def output_id(text):
+    # Short content hash of one stage output; the same text always gets the same ID
+    return hashlib.sha256(str(text).encode("utf-8")).hexdigest()[:16]
+
+
+def _check_id(value, what):
+    if not isinstance(value, str) or not value or len(value) > MAX_ID_LENGTH:
+        raise ValueError(f"{what} must be a non-empty string of at most {MAX_ID_LENGTH} characters")
+    return value
+
+
+def parse_feedback_ids(result_id, stage_ids):
+    """Validate the IDs sent with a feedback click; stage_ids is the JSON text of {stage name: output ID}.
+
+    Returns (result_id, stage_ids dict or None); raises ValueError for anything else.
+    """
+    if result_id:
+        _check_id(result_id, "result_id")
+    if not stage_ids:
+        return result_id or None, None
+    parsed = json.loads(stage_ids)
+    if not isinstance(parsed, dict) or len(parsed) > MAX_STAGE_IDS:
+        raise ValueError(f"stage_ids must be a JSON object with at most {MAX_STAGE_IDS} entries")
+    for name, value in parsed.items():
+        _check_id(name, "stage name")
+        _check_id(value, f"stage_ids[{name!r}]")
+    return result_id or None, parsed
+
+
+class FeedbackStore:
+    def __init__(self, path=FEEDBACK_DB, flush_ms=FEEDBACK_FLUSH_MS, stats_ttl=FEEDBACK_STATS_TTL):
+        self.path = path
+        self.flush_interval = flush_ms / 1000.0
+        self.stats_ttl = stats_ttl
+        self.written = 0
+        self.dropped = 0
+        self._start()
+
+    def _start(self):
+        self._queue = queue.Queue(maxsize=FEEDBACK_QUEUE_SIZE)
+        self._lock = threading.Lock()
+        # Recorded here but not yet committed, by verdict
+        self._pending = dict.fromkeys(VERDICTS, 0)
+        self._cached = None
+        self._cached_at = 0.0
+        self._generation = 0
+        # The writer thread has its own connection; stats() reads through another one
+        self._db = self._connect()
+        self._reader = self._connect()
+        self._read_lock = threading.Lock()
+        self._writer = threading.Thread(target=self._run, args=(self._queue,), daemon=True, name="feedback-writer")
+        self._writer.start()
+
+    def _connect(self):
+        # timeout: other workers may hold the write lock for a moment
+        db = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS feedback_events ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, verdict TEXT NOT NULL, result_id TEXT, "
+            "stage_ids TEXT, created REAL NOT NULL)"
+        )
+        db.execute("CREATE INDEX IF NOT EXISTS feedback_events_result ON feedback_events (result_id)")
+        db.execute("CREATE TABLE IF NOT EXISTS feedback_counts (verdict TEXT PRIMARY KEY, count INTEGER NOT NULL)")
+        db.commit()
+        return db
+
+    def after_fork(self):
+        # The writer thread and the connection don't survive fork(); a forked worker gets its own
+        self._start()
+
+    def record(self, verdict, result_id=None, stage_ids=None):
+        if verdict not in VERDICTS:
+            raise ValueError(f"Unknown verdict: {verdict!r}")
+        event = (verdict, result_id, json.dumps(stage_ids) if stage_ids else None, time.time())
+        # Counted as pending before it's queued, so the writer can never take it off first
+        with self._lock:
+            self._pending[verdict] += 1
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            # The disk can't keep up; losing a click beats stalling the request
+            with self._lock:
+                self._pending[verdict] -= 1
+                self.dropped += 1
+
+    def _run(self, events):
+        while True:
+            batch = [events.get()]
+            time.sleep(self.flush_interval)
+            while True:
+                try:
+                    batch.append(events.get_nowait())
+                except queue.Empty:
+                    break
+            self._write(batch)
+
+    def _write(self, batch):
+        increments = {}
+        for verdict, _, _, _ in batch:
+            increments[verdict] = increments.get(verdict, 0) + 1
+        try:
+            with self._db:
+                self._db.executemany(
+                    "INSERT INTO feedback_events (verdict, result_id, stage_ids, created) VALUES (?, ?, ?, ?)",
+                    batch,
+                )
+                self._db.executemany(
+                    "INSERT INTO feedback_counts (verdict, count) VALUES (?, ?) "
+                    "ON CONFLICT(verdict) DO UPDATE SET count = count + excluded.count",
+                    list(increments.items()),
+                )
+            written = True
+        except sqlite3.Error as e:
+            print(f"Feedback write failed, dropping {len(batch)} events: {e}")
+            written = False
+        with self._lock:
+            # Moving events from pending to committed and invalidating the cached counts in one step keeps
+            # stats() from counting them twice or not at all
+            for verdict, count in increments.items():
+                self._pending[verdict] -= count
+            if written:
+                self.written += len(batch)
+                self._cached = None
+                self._generation += 1
+            else:
+                self.dropped += len(batch)
+
+    def flush(self, timeout=5.0):
+        # Waits until everything recorded so far has been written (used at exit)
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            with self._lock:
+                if not any(self._pending.values()):
+                    return True
+            time.sleep(self.flush_interval / 2 or 0.01)
+        return False
+
+    def _counts(self):
+        now = time.monotonic()
+        with self._lock:
+            if self._cached is not None and now - self._cached_at < self.stats_ttl:
+                return self._cached
+            generation = self._generation
+        with self._read_lock:
+            rows = self._reader.execute("SELECT verdict, count FROM feedback_counts").fetchall()
+        counts = dict.fromkeys(VERDICTS, 0)
+        counts.update(rows)
+        with self._lock:
+            # Only cache a read that no commit has overtaken since
+            if generation == self._generation:
+                self._cached, self._cached_at = counts, now
+        return counts
+
+    def stats(self):
+        counts = self._counts()
+        with self._lock:
+            pending = dict(self._pending)
+            return {
+                "approved_count": counts["approved"] + pending["approved"],
+                "disapproved_count": counts["disapproved"] + pending["disapproved"],
+                "pending_writes": sum(pending.values()),
+                "written": self.written,
+                "dropped": self.dropped,
+            }
+
+    def events_for(self, result_id):
+        with self._read_lock:
+            rows = self._reader.execute(
+                "SELECT verdict, stage_ids, created FROM feedback_events WHERE result_id = ? ORDER BY id", (result_id,)
+            ).fetchall()
+        return [
+            {"verdict": verdict, "stage_ids": json.loads(stage_ids) if stage_ids else None, "created": created}
+            for verdict, stage_ids, created in rows
+        ]
+
+
+_feedback_store = None
+_feedback_store_lock = threading.Lock()
+
+
+def get_feedback_store():
+    # One store per process; opened on first use so importing this module doesn't create the file
+    global _feedback_store
+    if _feedback_store is None:
+        with _feedback_store_lock:
+            if _feedback_store is None:
+                _feedback_store = FeedbackStore()
+                atexit.register(_feedback_store.flush)
+    return _feedback_store
+
+
+def after_fork():
+    # Only a store the parent had already opened needs rebuilding
+    if _feedback_store is not None:
+        _feedback_store.after_fork()
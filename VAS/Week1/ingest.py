@@ -0,0 +1,135 @@
+# Streaming ingestion of a mail spool (mbox, Maildir or JSONL) through the email pipeline
+# - Messages are read lazily (see mail_spool.py) and fed to a pool of workers with a bounded number in flight,
+#   the same way bulk_process.py does; each result is appended to a JSONL file as soon as it finishes.
+# - Messages with a Message-ID that was already processed (re-deliveries, the same mail in two folders)
+#   are skipped.
+# - Progress is checkpointed in a small SQLite file next to the output: the byte offset before which every
+#   message is done, plus the keys of all finished messages. Rerunning the same command after a crash
+#   continues from the checkpoint and skips messages past it that had already finished. A result written
+#   just before the crash but not yet checkpointed can show up twice in the output.
+# - Memory stays flat however big the spool is: it is never loaded, work in flight is bounded and the
+#   seen keys live on disk.
+# Usage: python ingest.py ~/Mail/inbox.mbox results.jsonl --workers 8
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import time
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from bulk_process import InvalidRecord, ProgressReporter, _process_one, build_bulk_system
+from mail_spool import read_spool, detect_format
+
+
+class IngestState:
+    # Used from the main thread only: the reader and the result writer both run there
+    def __init__(self, path, source):
+        self.source = source
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS seen (key TEXT PRIMARY KEY, run INTEGER NOT NULL, done INTEGER NOT NULL)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS checkpoints (source TEXT PRIMARY KEY, offset INTEGER NOT NULL, updated REAL NOT NULL)")
+        # Keys claimed by an earlier, interrupted run but never finished get processed again
+        self.run = (self.db.execute("SELECT MAX(run) FROM seen").fetchone()[0] or 0) + 1
+        self.db.commit()
+        self.skipped = 0
+
+    def offset(self):
+        row = self.db.execute("SELECT offset FROM checkpoints WHERE source = ?", (self.source,)).fetchone()
+        return row[0] if row else 0
+
+    def claim(self, key):
+        # True if this message should be processed now; False for a duplicate or an already finished message
+        row = self.db.execute("SELECT run, done FROM seen WHERE key = ?", (key,)).fetchone()
+        if row is not None and (row[1] or row[0] == self.run):
+            self.skipped += 1
+            return False
+        self.db.execute("INSERT OR REPLACE INTO seen (key, run, done) VALUES (?, ?, 0)", (key, self.run))
+        return True
+
+    def finish(self, keys, offset):
+        # Called after the results are written and flushed, in one transaction with the new checkpoint
+        with self.db:
+            self.db.executemany("UPDATE seen SET done = 1 WHERE key = ?", [(key,) for key in keys])
+            if offset is not None:
+                self.db.execute(
+                    "INSERT OR REPLACE INTO checkpoints (source, offset, updated) VALUES (?, ?, ?)",
+                    (self.source, offset, time.time()),
+                )
+
+
+def ingest(path, system, output, state, fmt="auto", workers=8, max_in_flight=None, progress_every=10):
+    max_in_flight = max(max_in_flight or workers * 2, workers)
+    progress = ProgressReporter(None, progress_every)
+    start = state.offset()
+    if start:
+        print(f"Resuming {path} from byte {start}", file=progress.stream, flush=True)
+
+    # key -> (start offset, message fields for the result) for messages read but not yet written
+    pending = OrderedDict()
+    # End of the last message that was submitted or skipped; the one being read may not have been yet
+    read_offset = start
+
+    def write(done):
+        for future in done:
+            result = future.result()
+            offset, fields = pending.pop(result["id"])
+            result.update(fields)
+            output.write(json.dumps(result) + "\n")
+            progress.update(result)
+        output.flush()
+        os.fsync(output.fileno())
+        # Everything before the oldest unfinished message is done
+        offsets = [offset for offset, _ in pending.values() if offset is not None]
+        state.finish([future.result()["id"] for future in done], min(offsets) if offsets else read_offset)
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ingest") as pool:
+        in_flight = set()
+        for message in read_spool(path, fmt, start):
+            if not state.claim(message["key"]):
+                read_offset = message["next_offset"]
+                continue
+            # Bounded queue: wait for a slot before reading further
+            if len(in_flight) >= max_in_flight:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                write(done)
+            pending[message["key"]] = (message["offset"], {
+                "message_id": message["message_id"],
+                "subject": message["subject"],
+                "from": message["from"],
+                "date": message["date"],
+                "source_offset": message["offset"],
+            })
+            # A line the reader couldn't parse is written as a failed result and checkpointed past like any other
+            email = InvalidRecord(message["error"]) if message.get("error") else message["email"]
+            in_flight.add(pool.submit(_process_one, system, message["key"], email))
+            read_offset = message["next_offset"]
+        done, _ = wait(in_flight)
+        write(done)
+
+    print(f"Finished: {progress.line()}, {state.skipped} duplicate or already processed messages skipped", file=progress.stream, flush=True)
+    return progress
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Process a mail spool (mbox, Maildir or JSONL) into a JSONL file of results")
+    parser.add_argument("spool", help="mbox file, Maildir directory or JSONL file")
+    parser.add_argument("output", nargs="?", default="results.jsonl", help="JSONL file to append results to")
+    parser.add_argument("--format", choices=["auto", "mbox", "maildir", "jsonl"], default="auto")
+    parser.add_argument("--state", help="Checkpoint database (default: <output>.state)")
+    parser.add_argument("--workers", type=int, default=8, help="Emails processed concurrently")
+    parser.add_argument("--max-in-flight", type=int, help="Emails read but not yet written (default 2x workers)")
+    parser.add_argument("--progress-every", type=int, default=10, help="Print progress every N emails")
+    args = parser.parse_args()
+
+    fmt = detect_format(args.spool) if args.format == "auto" else args.format
+    state = IngestState(args.state or args.output + ".state", f"{fmt}:{os.path.abspath(args.spool)}")
+    system = build_bulk_system(args.workers)
+    with open(args.output, "a", encoding="utf-8") as output:
+        try:
+            ingest(args.spool, system, output, state, fmt, args.workers, args.max_in_flight, args.progress_every)
+        except KeyboardInterrupt:
+            print("Interrupted; rerun the same command to continue from the last checkpoint", file=sys.stderr)
+            sys.exit(130)
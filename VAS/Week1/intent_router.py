@@ -0,0 +1,98 @@
+# Embedding-based intent routing for the email pipeline
+# - One centroid per example category (medical_records, insurance_verification, ...), built from the
+#   MiniLM embeddings the example retriever has already computed; several examples of a category
+#   ("medication_refill:2", ...) are averaged into one centroid.
+# - An email is assigned the nearest centroid by cosine similarity. Confidence is that similarity plus its
+#   margin over the runner-up; only confident matches get a trimmed pipeline profile, everything else runs in full.
+# - Every decision is printed and counted, so the saved LLM calls can be read from stats() or /metrics.
+import threading
+
+import numpy as np
+
+from vector_index import normalize_rows
+
+# Stages each profile leaves out; "full" is the regular six-call pipeline
+PIPELINE_PROFILES = {
+    "full": (),
+    "routine": ("policy_justification", "example_justification"),
+}
+
+# Intents whose emails are routine enough to skip the justifiers; anything else (e.g. records requests,
+# which carry HIPAA concerns) keeps the full pipeline
+INTENT_PROFILES = {
+    "appointment_scheduling": "routine",
+    "medication_refill": "routine",
+    "insurance_verification": "routine",
+}
+
+MIN_SIMILARITY = 0.5
+MIN_MARGIN = 0.05
+
+
+def intent_of_key(key):
+    # "medication_refill:2" -> "medication_refill"
+    return str(key).split(":", 1)[0]
+
+
+class IntentRouter:
+    def __init__(self, intents, embeddings, profiles=None, min_similarity=MIN_SIMILARITY, min_margin=MIN_MARGIN):
+        # intents[i] is the category of embeddings[i]
+        embeddings = normalize_rows(embeddings)
+        self.intents = sorted(set(intents))
+        labels = np.array(list(intents))
+        self.centroids = normalize_rows(
+            np.vstack([embeddings[labels == intent].mean(axis=0) for intent in self.intents])
+        )
+        self.profiles = INTENT_PROFILES if profiles is None else profiles
+        self.min_similarity = min_similarity
+        self.min_margin = min_margin
+        self._lock = threading.Lock()
+        self.routes = {}
+        self.skipped_stages = 0
+
+    @classmethod
+    def from_retriever(cls, retriever, **kwargs):
+        # Reuse the vectors the retriever's index already holds (in key order); only a backend that can't
+        # return them (faiss) makes us encode the corpus again
+        keys = list(retriever.index.keys)
+        matrix = retriever.index.vectors()
+        if matrix is None:
+            matrix = retriever.encode_corpus([retriever.documents[key] for key in keys])
+        return cls([intent_of_key(key) for key in keys], matrix, **kwargs)
+
+    def classify(self, embedding):
+        # Returns (intent, similarity, margin over the second-best intent)
+        scores = self.centroids @ normalize_rows(embedding)[0]
+        order = np.argsort(scores)[::-1]
+        best = float(scores[order[0]])
+        runner_up = float(scores[order[1]]) if len(order) > 1 else -1.0
+        return self.intents[order[0]], best, best - runner_up
+
+    def route(self, embedding):
+        intent, similarity, margin = self.classify(embedding)
+        confident = similarity >= self.min_similarity and margin >= self.min_margin
+        profile = self.profiles.get(intent, "full") if confident else "full"
+        decision = {
+            "intent": intent,
+            "similarity": round(similarity, 4),
+            "margin": round(margin, 4),
+            "profile": profile,
+            "skipped_stages": list(PIPELINE_PROFILES[profile]),
+        }
+        with self._lock:
+            self.routes[(intent, profile)] = self.routes.get((intent, profile), 0) + 1
+            self.skipped_stages += len(decision["skipped_stages"])
+        print(f"Routing: intent={intent} similarity={similarity:.3f} margin={margin:.3f} profile={profile}")
+        return decision
+
+    def stats(self):
+        with self._lock:
+            by_intent = {}
+            for (intent, profile), count in self.routes.items():
+                by_intent.setdefault(intent, {})[profile] = count
+            return {
+                "routed": sum(self.routes.values()),
+                "by_intent": by_intent,
+                # Each skipped stage is one LLM call saved
+                "llm_calls_saved": self.skipped_stages,
+            }
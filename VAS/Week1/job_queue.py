@@ -0,0 +1,274 @@
+# Persistent background job queue for email processing
+# - submit() stores the job in SQLite (WAL mode) and returns its ID at once; a small pool of worker threads
+#   runs the handler, so a slow multi-call pipeline no longer holds an HTTP request thread.
+# - Stage results are saved as they finish, so polling shows partial results while a job is running.
+# - Jobs survive restarts: anything still queued is picked up again. A running job holds a lease that its
+#   process renews every few seconds; when the process dies the lease expires and the job is put back in
+#   the queue. A worker that has lost its lease (expired, or the job was cancelled) stops at the next stage.
+# - The queue depth is bounded (submit() raises QueueFull); finished jobs are deleted after the TTL.
+# - cancel() drops a queued job straight away; a running one stops at its next stage boundary.
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+JOB_DB = os.environ.get("JOB_DB", "jobs.db")
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "4"))
+JOB_QUEUE_DEPTH = int(os.environ.get("JOB_QUEUE_DEPTH", "1000"))
+JOB_TTL = float(os.environ.get("JOB_TTL", "3600"))
+# How often idle workers look for jobs submitted by other processes, and how often expired jobs are purged
+JOB_POLL_SECONDS = 1.0
+JOB_REAP_SECONDS = 60.0
+# A running job whose lease hasn't been renewed for this long belongs to a dead process; live workers renew
+# theirs three times per lease period
+JOB_LEASE_SECONDS = float(os.environ.get("JOB_LEASE_SECONDS", "30"))
+
+FINISHED = ("done", "failed", "cancelled", "expired")
+
+
+class QueueFull(Exception):
+    pass
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class JobQueue:
+    def __init__(self, handler, path=JOB_DB, workers=JOB_WORKERS, max_depth=JOB_QUEUE_DEPTH, ttl=JOB_TTL,
+                 lease_seconds=JOB_LEASE_SECONDS):
+        # handler(payload, on_stage) -> JSON-serializable result; on_stage(name, value) saves a partial result
+        self.handler = handler
+        self.path = path
+        self.workers = workers
+        self.max_depth = max_depth
+        self.ttl = ttl
+        self.lease_seconds = lease_seconds
+        self._start()
+
+    def _start(self):
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._db = self._connect()
+        self.completed = 0
+        self.failed = 0
+        # job ID -> lease for the jobs this process is running
+        self._leases = {}
+        self._recover()
+        self._threads = [
+            threading.Thread(target=self._run, daemon=True, name=f"job-worker-{i}") for i in range(self.workers)
+        ]
+        self._threads.append(threading.Thread(target=self._heartbeat, daemon=True, name="job-heartbeat"))
+        for thread in self._threads:
+            thread.start()
+
+    def _connect(self):
+        db = sqlite3.connect(self.path, timeout=10, check_same_thread=False, isolation_level=None)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, status TEXT NOT NULL, payload TEXT NOT NULL, partial TEXT, result TEXT, "
+            "error TEXT, owner INTEGER, created REAL NOT NULL, started REAL, finished REAL, lease TEXT, heartbeat REAL)"
+        )
+        # Databases created before leases existed
+        columns = {row[1] for row in db.execute("PRAGMA table_info(jobs)")}
+        for column, kind in (("lease", "TEXT"), ("heartbeat", "REAL")):
+            if column not in columns:
+                db.execute(f"ALTER TABLE jobs ADD COLUMN {column} {kind}")
+        db.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created)")
+        return db
+
+    def after_fork(self):
+        # Worker threads and the connection don't survive fork(); each forked process runs its own
+        self._start()
+
+    def _execute(self, sql, params=()):
+        # One connection per queue, shared by the HTTP and worker threads
+        with self._lock:
+            return self._db.execute(sql, params).fetchall()
+
+    def _recover(self):
+        # At startup nothing runs here yet, so a job marked as ours is left over from an earlier process that
+        # had the same PID (common for PID 1 in containers); jobs whose lease expired were interrupted too
+        self._requeue_expired(os.getpid())
+
+    def _requeue_expired(self, stale_owner=None):
+        # Puts running jobs whose lease wasn't renewed in time (or, at startup, that name this PID) back in the queue
+        cutoff = time.time() - self.lease_seconds
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id FROM jobs WHERE status = 'running' AND (heartbeat IS NULL OR heartbeat < ? OR owner = ?)",
+                (cutoff, stale_owner),
+            ).fetchall()
+            for (job_id,) in rows:
+                self._db.execute(
+                    "UPDATE jobs SET status = 'queued', owner = NULL, lease = NULL, heartbeat = NULL, started = NULL "
+                    "WHERE id = ? AND status = 'running'",
+                    (job_id,),
+                )
+                print(f"Requeued interrupted job {job_id}")
+            if rows:
+                self._wakeup.notify_all()
+        return len(rows)
+
+    def submit(self, payload):
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            depth = self._db.execute("SELECT COUNT(*) FROM jobs WHERE status IN ('queued', 'running')").fetchone()[0]
+            if depth >= self.max_depth:
+                raise QueueFull(f"{depth} jobs pending (limit {self.max_depth})")
+            self._db.execute(
+                "INSERT INTO jobs (id, status, payload, created) VALUES (?, 'queued', ?, ?)",
+                (job_id, json.dumps(payload), time.time()),
+            )
+            self._wakeup.notify()
+        return job_id
+
+    def get(self, job_id):
+        rows = self._execute(
+            "SELECT status, partial, result, error, created, started, finished FROM jobs WHERE id = ?", (job_id,)
+        )
+        if not rows:
+            return None
+        status, partial, result, error, created, started, finished = rows[0]
+        job = {
+            "job_id": job_id,
+            "status": status,
+            "partial": json.loads(partial) if partial else {},
+            "result": json.loads(result) if result else None,
+            "error": error,
+            "created": created,
+            "started": started,
+            "finished": finished,
+        }
+        if status == "queued":
+            job["position"] = self._execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND created < ?", (created,)
+            )[0][0]
+        return job
+
+    def cancel(self, job_id):
+        # Returns the job's status after the request, or None for an unknown job
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET status = 'cancelled', finished = ? WHERE id = ? AND status IN ('queued', 'running')",
+                (now, job_id),
+            )
+            # A running job's worker (in this process or another) notices when it saves its next stage
+            row = self._db.execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return row[0] if row else None
+
+    def _claim(self):
+        # Atomically moves the oldest queued job to running under a new lease; safe across processes sharing the file
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._db.execute(
+                    "SELECT id, payload FROM jobs WHERE status = 'queued' ORDER BY created LIMIT 1"
+                ).fetchone()
+                if row is not None:
+                    lease = uuid.uuid4().hex
+                    now = time.time()
+                    self._db.execute(
+                        "UPDATE jobs SET status = 'running', owner = ?, lease = ?, heartbeat = ?, started = ? WHERE id = ?",
+                        (os.getpid(), lease, now, now, row[0]),
+                    )
+                    row = (*row, lease)
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+            if row is not None:
+                self._leases[row[0]] = row[2]
+            return row
+
+    def _heartbeat(self):
+        # Renews this process's leases, and requeues jobs whose owner stopped renewing theirs
+        while True:
+            time.sleep(self.lease_seconds / 3)
+            with self._lock:
+                now = time.time()
+                self._db.executemany(
+                    "UPDATE jobs SET heartbeat = ? WHERE id = ? AND lease = ? AND status = 'running'",
+                    [(now, job_id, lease) for job_id, lease in self._leases.items()],
+                )
+            self._requeue_expired()
+
+    def _run(self):
+        last_reap = 0.0
+        while True:
+            if time.monotonic() - last_reap > JOB_REAP_SECONDS:
+                self.reap()
+                last_reap = time.monotonic()
+            job = self._claim()
+            if job is None:
+                with self._lock:
+                    self._wakeup.wait(JOB_POLL_SECONDS)
+                continue
+            self._process(*job)
+
+    def _process(self, job_id, payload, lease):
+        partial = {}
+
+        def on_stage(name, value):
+            partial[name] = value
+            with self._lock:
+                updated = self._db.execute(
+                    "UPDATE jobs SET partial = ? WHERE id = ? AND status = 'running' AND lease = ?",
+                    (json.dumps(partial), job_id, lease),
+                ).rowcount
+            # The row is no longer ours once the job has been cancelled, or requeued after our lease expired
+            if not updated:
+                raise JobCancelled(job_id)
+
+        try:
+            result = self.handler(json.loads(payload), on_stage)
+        except JobCancelled:
+            print(f"Job {job_id} cancelled or taken over")
+        except Exception as e:
+            self.failed += 1
+            self._execute(
+                "UPDATE jobs SET status = 'failed', error = ?, finished = ? WHERE id = ? AND status = 'running' AND lease = ?",
+                (f"{type(e).__name__}: {e}", time.time(), job_id, lease),
+            )
+        else:
+            self.completed += 1
+            # A cancel that lands after the last stage still wins
+            self._execute(
+                "UPDATE jobs SET status = 'done', result = ?, finished = ? WHERE id = ? AND status = 'running' AND lease = ?",
+                (json.dumps(result), time.time(), job_id, lease),
+            )
+        finally:
+            with self._lock:
+                self._leases.pop(job_id, None)
+
+    def reap(self):
+        # Finished jobs are kept for the TTL so their results can be fetched; queued ones that waited that
+        # long are given up on
+        cutoff = time.time() - self.ttl
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET status = 'expired', finished = ? WHERE status = 'queued' AND created < ?",
+                (time.time(), cutoff),
+            )
+            deleted = self._db.execute(
+                f"DELETE FROM jobs WHERE status IN ({', '.join('?' * len(FINISHED))}) AND finished < ?",
+                (*FINISHED, cutoff),
+            ).rowcount
+        return deleted
+
+    def stats(self):
+        counts = dict(self._execute("SELECT status, COUNT(*) FROM jobs GROUP BY status"))
+        return {
+            "workers": self.workers,
+            "max_depth": self.max_depth,
+            "ttl_seconds": self.ttl,
+            "lease_seconds": self.lease_seconds,
+            "depth": counts.get("queued", 0) + counts.get("running", 0),
+            "by_status": counts,
+            "completed_here": self.completed,
+            "failed_here": self.failed,
+        }
@@ -0,0 +1,90 @@
+# Deferred imports and startup timing
+# - lazy_import("sentence_transformers") returns a stand-in that imports the real module on first attribute
+#   access, so heavy libraries (torch via sentence_transformers, faiss, ...) are only loaded when used.
+# - startup_timer records how long each import and init phase took, relative to when this module was
+#   first imported, so cold starts can be broken down (see /readyz in EmailProcessor10).
+import importlib
+import importlib.util
+import threading
+import time
+from contextlib import contextmanager
+
+
+class StartupTimer:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self._last_mark = self.started
+        self._lock = threading.Lock()
+        self.phases = []
+        self.current = None
+
+    def _record(self, name, start, end):
+        with self._lock:
+            self.phases.append({
+                "phase": name,
+                "start": round(start - self.started, 4),
+                "seconds": round(end - start, 4),
+            })
+
+    @contextmanager
+    def phase(self, name):
+        previous, self.current = self.current, name
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._record(name, start, time.perf_counter())
+            self.current = previous
+
+    def mark(self, name):
+        # Records everything since the previous mark (or start) as one phase, e.g. a block of imports
+        now = time.perf_counter()
+        self._record(name, self._last_mark, now)
+        self._last_mark = now
+
+    def report(self):
+        with self._lock:
+            return {
+                "seconds_since_start": round(time.perf_counter() - self.started, 4),
+                "current_phase": self.current,
+                "phases": list(self.phases),
+            }
+
+
+# One timer per process
+startup_timer = StartupTimer()
+
+
+class LazyModule:
+    def __init__(self, name, timer=startup_timer):
+        self._name = name
+        self._timer = timer
+        self._module = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    with self._timer.phase(f"import {self._name}"):
+                        self._module = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __repr__(self):
+        state = "loaded" if self._module is not None else "not loaded"
+        return f"<lazy module {self._name!r} ({state})>"
+
+
+def lazy_import(name):
+    return LazyModule(name)
+
+
+def is_available(name):
+    # Checks that a module can be imported without importing it
+    try:
+        return importlib.util.find_spec(name) is not None
+    except (ImportError, ValueError):
+        return False
@@ -0,0 +1,135 @@
+# LLM response cache
+# - Responses are keyed by model, a hash of the prompt and the generation parameters.
+# - An in-memory LRU with a TTL answers repeated prompts in microseconds; an optional SQLite file
+#   (write-through, WAL mode) keeps them across restarts and between processes.
+# - Pass use_cache=False (bypass) for calls that are meant to be non-deterministic.
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+LLM_CACHE_SIZE = int(os.environ.get("LLM_CACHE_SIZE", "2048"))
+LLM_CACHE_TTL = float(os.environ.get("LLM_CACHE_TTL", str(24 * 3600)))
+LLM_CACHE_SQLITE = os.environ.get("LLM_CACHE_SQLITE")
+
+
+class LLMCache:
+    def __init__(self, max_entries=LLM_CACHE_SIZE, ttl=LLM_CACHE_TTL, sqlite_path=LLM_CACHE_SQLITE):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.bypassed = 0
+
+        self.sqlite_path = sqlite_path
+        self._db = self._connect() if sqlite_path else None
+
+    def _connect(self):
+        db = sqlite3.connect(self.sqlite_path, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("CREATE TABLE IF NOT EXISTS llm_cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL)")
+        db.commit()
+        return db
+
+    def after_fork(self):
+        # SQLite connections must not be used across fork(); each worker opens its own
+        self._lock = threading.Lock()
+        if self.sqlite_path:
+            self._db = self._connect()
+
+    @staticmethod
+    def make_key(model, prompt, params=None):
+        prompt_hash = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        raw = json.dumps({"model": model, "prompt": prompt_hash, "params": params or {}}, sort_keys=True)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, created = entry
+                if now - created <= self.ttl:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+
+            if self._db is not None:
+                row = self._db.execute("SELECT value, created FROM llm_cache WHERE key = ?", (key,)).fetchone()
+                if row is not None and now - row[1] <= self.ttl:
+                    self._remember(key, row[0], row[1])
+                    self.disk_hits += 1
+                    return row[0]
+
+            self.misses += 1
+            return None
+
+    def set(self, key, value):
+        created = time.time()
+        with self._lock:
+            self._remember(key, value, created)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO llm_cache (key, value, created) VALUES (?, ?, ?)",
+                    (key, value, created),
+                )
+                self._db.commit()
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+            if self._db is not None:
+                self._db.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                self._db.commit()
+
+    def _remember(self, key, value, created):
+        self._entries[key] = (value, created)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get_or_call(self, model, prompt, params, call, use_cache=True, validate=None):
+        # validate(value) raises for answers that must not be cached (e.g. JSON that doesn't match its schema);
+        # the error propagates and the answer isn't stored, so the next call asks the model again
+        if not use_cache:
+            with self._lock:
+                self.bypassed += 1
+            return call()
+        key = self.make_key(model, prompt, params)
+        value = self.get(key)
+        if value is not None and validate is not None:
+            try:
+                validate(value)
+            except Exception:
+                # Stored before validation existed for this call
+                self.delete(key)
+                value = None
+        if value is None:
+            value = call()
+            if validate is not None:
+                validate(value)
+            self.set(key, value)
+        return value
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "bypassed": self.bypassed,
+                "hit_rate": round((self.hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+            }
+
+
+# Shared by every prompt_llm call in the process
+llm_cache = LLMCache()
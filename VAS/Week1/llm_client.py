@@ -0,0 +1,168 @@
+# Shared LLM client for the email apps
+# - One long-lived HTTP session per process talks to Together's OpenAI-compatible chat endpoint,
+#   so TCP/TLS connections are kept alive and reused instead of being set up for every request.
+# - The connection pool size is configurable; warmup() opens the connections at startup.
+# - acomplete() is an awaitable variant for asyncio callers.
+# - Every call goes through a RateLimiter (token buckets, 429-aware retries, AIMD concurrency).
+import asyncio
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from ApiKey import API_KEY
+from rate_limiter import RateLimiter, RetryableError
+from usage_tracker import count_tokens
+
+TOGETHER_BASE_URL = "https://api.together.xyz/v1"
+DEFAULT_LLM_MODEL = "meta-llama/Meta-Llama-3-8B-Instruct-Lite"
+LLM_BASE_URL = os.environ.get("LLM_BASE_URL", TOGETHER_BASE_URL)
+LLM_POOL_SIZE = int(os.environ.get("LLM_POOL_SIZE", "16"))
+LLM_TIMEOUT = float(os.environ.get("LLM_TIMEOUT", "60"))
+
+
+def _retry_after(response):
+    try:
+        return float(response.headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
+
+
+def estimate_tokens(prompt, model, max_tokens=0):
+    # Pre-flight estimate for the tokens-per-minute bucket: prompt tokens plus the completion budget
+    return count_tokens(prompt, model) + (max_tokens or 0)
+
+
+class LLMClient:
+    def __init__(self, api_key, base_url=LLM_BASE_URL, pool_size=LLM_POOL_SIZE, timeout=LLM_TIMEOUT, limiter=None):
+        self.base_url = base_url.rstrip("/")
+        self.limiter = limiter or RateLimiter(max_concurrency=pool_size)
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.api_key = api_key
+        self.session = self._new_session()
+        self._async_slots = None
+
+    def _new_session(self):
+        session = requests.Session()
+        # pool_block makes extra callers wait for a pooled connection instead of opening throwaway ones
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, pool_block=True)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        session.headers.update({
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json",
+        })
+        return session
+
+    def after_fork(self):
+        # A forked worker must not reuse the parent's sockets; the old pool is dropped without closing
+        # them, since closing would also tear down the parent's (or a sibling's) connections
+        self.session = self._new_session()
+        self._async_slots = None
+
+    def chat(self, prompt, model=DEFAULT_LLM_MODEL, **params):
+        # Returns the raw chat completion JSON (choices, usage, ...)
+        payload = {"model": model, "messages": [{"role": "user", "content": prompt}], **params}
+        return self.limiter.call(
+            lambda: self._post("/chat/completions", payload),
+            estimate_tokens(prompt, model, params.get("max_tokens")),
+        )
+
+    def _post(self, path, payload):
+        try:
+            response = self.session.post(f"{self.base_url}{path}", json=payload, timeout=self.timeout)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            raise RetryableError(str(e)) from e
+        if response.status_code == 429:
+            raise RetryableError("Rate limited (429)", _retry_after(response), throttled=True)
+        if response.status_code >= 500:
+            raise RetryableError(f"Server error ({response.status_code})", _retry_after(response))
+        response.raise_for_status()
+        return response.json()
+
+    def stream(self, prompt, model=DEFAULT_LLM_MODEL, on_usage=None, **params):
+        # Yields content deltas as the provider streams them (server-sent events);
+        # on_usage receives the usage block if the provider includes one in the stream
+        payload = {"model": model, "messages": [{"role": "user", "content": prompt}], "stream": True, **params}
+        # Only opening the stream is rate limited and retried; tokens are read after the slot is released
+        response = self.limiter.call(
+            lambda: self._open_stream("/chat/completions", payload),
+            estimate_tokens(prompt, model, params.get("max_tokens")),
+        )
+        with response:
+            for line in response.iter_lines(decode_unicode=True):
+                if not line or not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                chunk = json.loads(data)
+                if on_usage is not None and chunk.get("usage"):
+                    on_usage(chunk["usage"])
+                choices = chunk.get("choices") or [{}]
+                delta = choices[0].get("delta", {}).get("content")
+                if delta:
+                    yield delta
+
+    def _open_stream(self, path, payload):
+        try:
+            response = self.session.post(f"{self.base_url}{path}", json=payload, timeout=self.timeout, stream=True)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            raise RetryableError(str(e)) from e
+        if response.status_code == 429 or response.status_code >= 500:
+            response.close()
+            raise RetryableError(
+                f"Stream rejected ({response.status_code})",
+                _retry_after(response),
+                throttled=response.status_code == 429,
+            )
+        response.raise_for_status()
+        return response
+
+    def complete(self, prompt, model=DEFAULT_LLM_MODEL, **params):
+        return self.chat(prompt, model, **params)["choices"][0]["message"]["content"]
+
+    async def achat(self, prompt, model=DEFAULT_LLM_MODEL, **params):
+        # Never more awaiting calls in flight than pooled connections
+        if self._async_slots is None:
+            self._async_slots = asyncio.Semaphore(self.pool_size)
+        async with self._async_slots:
+            return await asyncio.to_thread(self.chat, prompt, model, **params)
+
+    async def acomplete(self, prompt, model=DEFAULT_LLM_MODEL, **params):
+        return (await self.achat(prompt, model, **params))["choices"][0]["message"]["content"]
+
+    def warmup(self, connections=None):
+        # Open (and keep alive) up to `connections` pooled connections before the first request
+        connections = min(connections or self.pool_size, self.pool_size)
+
+        def touch(_):
+            try:
+                self.session.get(f"{self.base_url}/models", timeout=self.timeout).close()
+                return True
+            except requests.RequestException:
+                return False
+
+        with ThreadPoolExecutor(max_workers=connections) as pool:
+            return sum(pool.map(touch, range(connections)))
+
+    def close(self):
+        self.session.close()
+
+
+_shared_client = None
+_shared_client_lock = threading.Lock()
+
+
+def get_llm_client():
+    # One client (and connection pool) per process
+    global _shared_client
+    if _shared_client is None:
+        with _shared_client_lock:
+            if _shared_client is None:
+                _shared_client = LLMClient(API_KEY)
+    return _shared_client
@@ -0,0 +1,200 @@
+# Lazy readers for real mail spools: mbox files, Maildir directories and JSONL exports
+# - Messages are parsed one at a time while the file is read, so memory doesn't grow with the spool.
+# - Each message is reduced to the text the pipeline needs: "Subject: ...", a blank line and the plain-text
+#   body. Other headers, attachments and non-text MIME parts are dropped; HTML-only bodies are converted
+#   to text.
+# - Every message carries a dedupe key (its Message-ID, or a hash of the text when there is none) and, for
+#   mbox/JSONL, the byte offsets where it starts and where the next one starts, so a run can resume mid-file.
+# - A JSONL line that can't be read comes out as a record with "error" set and no email, so the caller can
+#   report it and move past it.
+import email
+import hashlib
+import html
+import json
+import os
+import re
+from email import policy
+
+# Longer bodies are cut (quoted threads, pasted logs); the pipeline's prompts are sized for short emails
+MAX_BODY_CHARS = int(os.environ.get("SPOOL_MAX_BODY_CHARS", "8000"))
+
+_TAG = re.compile(r"<[^>]+>")
+_BLOCK_TAG = re.compile(r"<(br|/p|/div|/li|/tr|/h\d)[^>]*>", re.IGNORECASE)
+_HIDDEN = re.compile(r"<(script|style)\b.*?</\1>", re.IGNORECASE | re.DOTALL)
+_BLANK_LINES = re.compile(r"\n\s*\n\s*\n+")
+
+
+def html_to_text(markup):
+    markup = _HIDDEN.sub("", markup)
+    markup = _BLOCK_TAG.sub("\n", markup)
+    return html.unescape(_TAG.sub("", markup))
+
+
+def _part_text(part):
+    try:
+        return part.get_content()
+    except (LookupError, UnicodeError):
+        # Unknown or wrong charset: decode the bytes leniently
+        payload = part.get_payload(decode=True) or b""
+        return payload.decode("utf-8", errors="replace")
+
+
+def message_body(msg):
+    # Prefers text/plain; falls back to the HTML part as text
+    part = msg.get_body(preferencelist=("plain", "html"))
+    if part is None:
+        return ""
+    text = _part_text(part)
+    if part.get_content_type() == "text/html":
+        text = html_to_text(text)
+    text = _BLANK_LINES.sub("\n\n", text.replace("\r\n", "\n")).strip()
+    return text[:MAX_BODY_CHARS]
+
+
+def normalize_message_id(value):
+    value = (value or "").strip().strip("<>").strip().lower()
+    return value or None
+
+
+def text_key(text):
+    return "sha256:" + hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def parse_message(raw, offset=None, next_offset=None):
+    # raw: the RFC 822 bytes of one message
+    msg = email.message_from_bytes(raw, policy=policy.default)
+    subject = str(msg.get("Subject", "") or "").strip()
+    body = message_body(msg)
+    text = f"Subject: {subject}\n\n{body}" if subject else body
+    message_id = normalize_message_id(str(msg.get("Message-ID", "") or ""))
+    return {
+        "key": message_id or text_key(text),
+        "message_id": message_id,
+        "subject": subject,
+        "from": str(msg.get("From", "") or ""),
+        "date": str(msg.get("Date", "") or ""),
+        "email": text,
+        "offset": offset,
+        "next_offset": next_offset,
+    }
+
+
+def iter_mbox(path, start=0):
+    # Reads the mbox line by line instead of through mailbox.mbox, which indexes the whole file up front.
+    # A message starts at a "From " line at the start of the file or after a blank line.
+    with open(path, "rb") as f:
+        f.seek(start)
+        lines = []
+        offset = start
+        previous_blank = True
+        while True:
+            position = f.tell()
+            line = f.readline()
+            if not line or (line.startswith(b"From ") and previous_blank):
+                if lines:
+                    yield parse_message(b"".join(lines), offset, position)
+                if not line:
+                    return
+                lines = []
+                offset = position
+                previous_blank = False
+                continue
+            previous_blank = line in (b"\n", b"\r\n")
+            # mboxrd escaping: ">From " at the start of a body line was "From "
+            if line.startswith(b">") and line.lstrip(b">").startswith(b"From "):
+                line = line[1:]
+            lines.append(line)
+
+
+def iter_maildir(path, start=None):
+    # Maildir has no offsets; finished messages are skipped on resume by their dedupe key instead.
+    # os.scandir streams directory entries rather than listing them all.
+    for sub in ("cur", "new"):
+        directory = os.path.join(path, sub)
+        if not os.path.isdir(directory):
+            continue
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.is_file() and not entry.name.startswith("."):
+                    with open(entry.path, "rb") as f:
+                        message = parse_message(f.read())
+                    if message["message_id"] is None:
+                        # The unique part of a Maildir file name survives flag changes (":2,S")
+                        message["key"] = "maildir:" + entry.name.split(":", 1)[0]
+                    yield message
+
+
+def invalid_record(offset, next_offset, error):
+    # Stands in for a line that couldn't be read, so the reader can carry on past it; "email" is None
+    return {
+        "key": f"invalid:{offset}",
+        "message_id": None,
+        "subject": "",
+        "from": "",
+        "date": "",
+        "email": None,
+        "error": error,
+        "offset": offset,
+        "next_offset": next_offset,
+    }
+
+
+def iter_jsonl(path, start=0):
+    # One record per line: {"email": ...} with optional "id"/"message_id"/"subject"/"from", a plain string,
+    # or {"raw": "<RFC 822 message>"} for exported mail. A malformed line yields an invalid_record().
+    with open(path, "rb") as f:
+        f.seek(start)
+        while True:
+            offset = f.tell()
+            line = f.readline()
+            if not line:
+                return
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                yield invalid_record(offset, f.tell(), f"line at byte {offset} is not valid JSON: {e}")
+                continue
+            if isinstance(record, str):
+                record = {"email": record}
+            if not isinstance(record, dict) or not isinstance(record.get("raw", record.get("email")), str):
+                yield invalid_record(offset, f.tell(), f'line at byte {offset} has no "email" or "raw" string')
+                continue
+            if "raw" in record:
+                message = parse_message(record["raw"].encode("utf-8"), offset, f.tell())
+            else:
+                text = record["email"][:MAX_BODY_CHARS]
+                message_id = normalize_message_id(record.get("message_id"))
+                message = {
+                    "key": message_id or (f"id:{record['id']}" if "id" in record else text_key(text)),
+                    "message_id": message_id,
+                    "subject": record.get("subject", ""),
+                    "from": record.get("from", ""),
+                    "date": record.get("date", ""),
+                    "email": text,
+                    "offset": offset,
+                    "next_offset": f.tell(),
+                }
+            yield message
+
+
+READERS = {"mbox": iter_mbox, "maildir": iter_maildir, "jsonl": iter_jsonl}
+
+
+def detect_format(path):
+    if os.path.isdir(path):
+        return "maildir"
+    if path.endswith((".jsonl", ".ndjson", ".json")):
+        return "jsonl"
+    with open(path, "rb") as f:
+        head = f.read(5)
+    return "mbox" if head == b"From " else "jsonl"
+
+
+def read_spool(path, fmt="auto", start=0):
+    """Yield messages lazily from an mbox file, Maildir directory or JSONL file, from byte offset start."""
+    fmt = detect_format(path) if fmt == "auto" else fmt
+    if fmt not in READERS:
+        raise ValueError(f"Unknown spool format {fmt!r}; expected one of {sorted(READERS)}")
+    return READERS[fmt](path, start or 0)
@@ -0,0 +1,185 @@
+# Prometheus-style metrics with near-zero recording cost
+# - Every thread records into its own dict (no locks on the hot path); a scrape merges all threads.
+# - Threads that have exited are folded into a shared "retired" total on the next scrape, so a
+#   thread-per-request server doesn't grow the list forever.
+# - render() produces the Prometheus text exposition format for a /metrics endpoint.
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class _ThreadStores:
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._stores = []
+        self.retired = {}
+
+    def current(self):
+        store = getattr(self._local, "store", None)
+        if store is None:
+            store = self._local.store = {}
+            # Registration happens once per thread
+            with self._lock:
+                self._stores.append((threading.current_thread(), store))
+        return store
+
+    def snapshot(self):
+        # Returns a list of per-thread dicts to merge, folding exited threads into `retired` first
+        with self._lock:
+            alive = []
+            for thread, store in self._stores:
+                if thread.is_alive():
+                    alive.append((thread, store))
+                else:
+                    for key, value in list(store.items()):
+                        _merge_into(self.retired, key, value)
+            self._stores = alive
+            return [self.retired] + [dict(store) for _, store in alive]
+
+
+def _merge_into(target, key, value):
+    if isinstance(value, list):
+        merged = target.get(key)
+        if merged is None:
+            target[key] = list(value)
+        else:
+            for i, v in enumerate(value):
+                merged[i] += v
+    else:
+        target[key] = target.get(key, 0) + value
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.stores = _ThreadStores()
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        merged = {}
+        for store in self.stores.snapshot():
+            for key, value in store.items():
+                _merge_into(merged, key, value)
+
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric.render(merged))
+        return "\n".join(lines) + "\n"
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    parts = []
+    for name, value in labels:
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        parts.append(f'{name}="{value}"')
+    return "{" + ",".join(parts) + "}"
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, registry, name, help, labelnames=()):
+        self.registry = registry
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        registry.register(self)
+
+    def _key(self, labels):
+        return (self.name, tuple((n, labels.get(n, "")) for n in self.labelnames))
+
+    def _series(self, merged):
+        return sorted((key[1], value) for key, value in merged.items() if key[0] == self.name)
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        store = self.registry.stores.current()
+        key = self._key(labels)
+        store[key] = store.get(key, 0) + amount
+
+    def render(self, merged):
+        return [f"{self.name}{_format_labels(labels)} {value}" for labels, value in self._series(merged)]
+
+
+class Gauge(Counter):
+    # inc/dec only, so per-thread values can simply be summed
+    type = "gauge"
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    @contextmanager
+    def track(self, **labels):
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, registry, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(registry, name, help, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        store = self.registry.stores.current()
+        key = self._key(labels)
+        # [count per bucket..., +Inf bucket, sum]
+        series = store.get(key)
+        if series is None:
+            series = store[key] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self, merged):
+        lines = []
+        for labels, series in self._series(merged):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series[:-1]):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(labels + (('le', bound),))} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {series[-1]}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {cumulative}")
+        return lines
+
+
+class CallbackMetric(_Metric):
+    # Sampled at scrape time from existing stats (e.g. cache hits/misses): fn() yields (labels dict or None, value)
+    def __init__(self, registry, name, help, type, fn):
+        self.type = type
+        self.fn = fn
+        super().__init__(registry, name, help)
+
+    def render(self, merged):
+        lines = []
+        for labels, value in self.fn():
+            lines.append(f"{self.name}{_format_labels(tuple(sorted((labels or {}).items())))} {value}")
+        return lines
+
+
+registry = MetricsRegistry()
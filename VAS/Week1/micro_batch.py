@@ -0,0 +1,91 @@
+# Micro-batching front-end for a SentenceTransformer
+# - Single-text encode() calls from many threads (Flask requests, bulk workers, pipeline stages) are queued;
+#   one worker thread waits up to max_wait_ms for more to arrive, encodes them as one batch and hands each
+#   caller its own row. Under load this turns N small forward passes into one larger, much cheaper one.
+# - Lists are already a batch and go straight to the model.
+# - Otherwise it behaves like the wrapped model, so it can be passed anywhere an encoder is expected.
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+ENCODE_BATCH_SIZE = int(os.environ.get("ENCODE_BATCH_SIZE", "64"))
+ENCODE_MICROBATCH_MS = float(os.environ.get("ENCODE_MICROBATCH_MS", "2"))
+
+
+class MicroBatchEncoder:
+    def __init__(self, model, max_batch_size=ENCODE_BATCH_SIZE, max_wait_ms=ENCODE_MICROBATCH_MS):
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.items = 0
+        self.largest_batch = 0
+        self._start_worker()
+
+    def _start_worker(self):
+        self._worker = threading.Thread(target=self._run, args=(self._queue,), daemon=True, name="encode-batcher")
+        self._worker.start()
+
+    def after_fork(self):
+        # Threads don't survive fork(); a forked worker gets its own queue and batching thread
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._start_worker()
+
+    def encode(self, sentences, **kwargs):
+        if not isinstance(sentences, str):
+            kwargs.setdefault("batch_size", self.max_batch_size)
+            return self.model.encode(list(sentences), **kwargs)
+        # Only plain single-text calls are batched; options would have to match across callers
+        if kwargs:
+            return self.model.encode(sentences, **kwargs)
+        future = Future()
+        self._queue.put((sentences, future))
+        return future.result()
+
+    def _run(self, requests):
+        while True:
+            batch = [requests.get()]
+            deadline = time.perf_counter() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                try:
+                    # Whatever queued up while the last batch ran is taken without waiting
+                    batch.append(requests.get(timeout=remaining) if remaining > 0 else requests.get_nowait())
+                except queue.Empty:
+                    break
+            self._encode_batch(batch)
+
+    def _encode_batch(self, batch):
+        texts = [text for text, _ in batch]
+        try:
+            embeddings = np.asarray(self.model.encode(texts, batch_size=self.max_batch_size))
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        for (_, future), embedding in zip(batch, embeddings):
+            future.set_result(embedding)
+        with self._lock:
+            self.batches += 1
+            self.items += len(batch)
+            self.largest_batch = max(self.largest_batch, len(batch))
+
+    def __getattr__(self, name):
+        # get_sentence_embedding_dimension(), device, ... come from the wrapped model
+        return getattr(self.model, name)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "batches": self.batches,
+                "items": self.items,
+                "mean_batch_size": round(self.items / self.batches, 2) if self.batches else 0.0,
+                "largest_batch": self.largest_batch,
+            }
@@ -0,0 +1,61 @@
+# Shared embedding model registry
+# - Loads each SentenceTransformer model once per process and hands the same instance to every retriever.
+# - Keeps simple counters (loads, load time, lookups) so we can check that no request pays for a model load.
+# - sentence_transformers (and torch with it) is only imported when the first model is loaded.
+import threading
+import time
+
+from ApiKey import HGToken
+from lazy_imports import lazy_import
+
+sentence_transformers = lazy_import("sentence_transformers")
+
+DEFAULT_MODEL = "all-MiniLM-L6-v2"
+
+
+def load_sentence_transformer(name):
+    return sentence_transformers.SentenceTransformer(name, use_auth_token=HGToken)
+
+
+class ModelRegistry:
+    def __init__(self, loader=load_sentence_transformer):
+        self._loader = loader
+        self._models = {}
+        self._lock = threading.Lock()
+        self.load_count = 0
+        self.load_seconds = 0.0
+        self.lookups = 0
+
+    def get(self, name=DEFAULT_MODEL):
+        self.lookups += 1
+        model = self._models.get(name)
+        if model is not None:
+            return model
+
+        # Double-checked so concurrent first requests still load the model only once
+        with self._lock:
+            model = self._models.get(name)
+            if model is None:
+                start = time.perf_counter()
+                model = self._loader(name)
+                self.load_seconds += time.perf_counter() - start
+                self.load_count += 1
+                self._models[name] = model
+        return model
+
+    def warmup(self, names=(DEFAULT_MODEL,)):
+        for name in names:
+            self.get(name)
+        return self.stats()
+
+    def stats(self):
+        return {
+            "models": sorted(self._models),
+            "load_count": self.load_count,
+            "load_seconds": round(self.load_seconds, 3),
+            "lookups": self.lookups,
+        }
+
+
+# One registry per process
+registry = ModelRegistry()
@@ -0,0 +1,144 @@
+# Client-side rate limiting for LLM calls
+# - Token buckets keep us under the provider's requests-per-minute and tokens-per-minute limits.
+# - Rate-limit (429), server (5xx) and connection errors are retried with jittered exponential backoff,
+#   honouring Retry-After when the server sends it.
+# - Concurrency adapts AIMD-style: +1 slot per window of successes, halved on every 429, so bulk runs
+#   settle just under the provider's limit instead of erroring.
+import os
+import random
+import threading
+import time
+
+LLM_RPM = float(os.environ.get("LLM_RPM", "600"))
+LLM_TPM = float(os.environ.get("LLM_TPM", "180000"))
+LLM_MAX_CONCURRENCY = int(os.environ.get("LLM_MAX_CONCURRENCY", "32"))
+LLM_MAX_RETRIES = int(os.environ.get("LLM_MAX_RETRIES", "5"))
+
+
+class RetryableError(Exception):
+    def __init__(self, message, retry_after=None, throttled=False):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.throttled = throttled
+
+
+class RetriesExhausted(Exception):
+    # Raised when a call still fails after all retries
+    pass
+
+
+class TokenBucket:
+    def __init__(self, per_minute, capacity=None):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity or per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, amount=1):
+        amount = min(amount, self.capacity)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                wait = (amount - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class AIMDConcurrency:
+    def __init__(self, initial=4, minimum=1, maximum=LLM_MAX_CONCURRENCY, decrease=0.5):
+        self.limit = float(min(max(initial, minimum), maximum))
+        self.minimum = minimum
+        self.maximum = maximum
+        self.decrease = decrease
+        self.in_flight = 0
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                self._condition.wait()
+            self.in_flight += 1
+
+    def release(self, succeeded=True, throttled=False):
+        with self._condition:
+            self.in_flight -= 1
+            if throttled:
+                # Multiplicative decrease on every rate-limit response
+                self.limit = max(self.minimum, self.limit * self.decrease)
+            elif succeeded:
+                # Additive increase: about one extra slot per `limit` successful calls
+                self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+            self._condition.notify_all()
+
+
+class RateLimiter:
+    def __init__(self, requests_per_minute=LLM_RPM, tokens_per_minute=LLM_TPM,
+                 max_concurrency=LLM_MAX_CONCURRENCY, max_retries=LLM_MAX_RETRIES,
+                 base_delay=0.5, max_delay=30.0):
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.concurrency = AIMDConcurrency(maximum=max_concurrency)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        # Counters are bumped from every calling thread
+        self._stats_lock = threading.Lock()
+        self.retries = 0
+        self.throttled = 0
+
+    def split(self, parts):
+        # Give this process 1/parts of the request and token budgets, e.g. one share per pre-forked worker
+        for bucket in (self.requests, self.tokens):
+            if bucket is not None:
+                bucket.rate /= parts
+                bucket.capacity /= parts
+                bucket.tokens = min(bucket.tokens, bucket.capacity)
+
+    def backoff(self, attempt, retry_after=None):
+        if retry_after is not None:
+            return min(float(retry_after), self.max_delay)
+        # Full jitter so retrying callers don't stampede together
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def call(self, func, estimated_tokens=1):
+        """Run func() within the rate limits, retrying RetryableError with backoff."""
+        for attempt in range(self.max_retries + 1):
+            if self.requests is not None:
+                self.requests.acquire(1)
+            if self.tokens is not None:
+                self.tokens.acquire(estimated_tokens)
+
+            self.concurrency.acquire()
+            succeeded = throttled = False
+            try:
+                result = func()
+                succeeded = True
+                return result
+            except RetryableError as e:
+                throttled = e.throttled
+                if throttled:
+                    with self._stats_lock:
+                        self.throttled += 1
+                if attempt == self.max_retries:
+                    raise RetriesExhausted(f"LLM call failed after {attempt + 1} attempts: {e}") from e
+                delay = self.backoff(attempt, e.retry_after)
+            finally:
+                self.concurrency.release(succeeded, throttled)
+            with self._stats_lock:
+                self.retries += 1
+            time.sleep(delay)
+
+    def stats(self):
+        with self._stats_lock:
+            retries, throttled = self.retries, self.throttled
+        return {
+            "concurrency_limit": round(self.concurrency.limit, 2),
+            "in_flight": self.concurrency.in_flight,
+            "retries": retries,
+            "throttled": throttled,
+        }
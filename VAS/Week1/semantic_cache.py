@@ -0,0 +1,83 @@
+# Semantic cache for whole-pipeline results
+# - Entries are keyed by the email's normalized embedding; a lookup returns the most similar cached entry
+#   if its cosine similarity reaches the threshold, so "need my refill" can reuse "running low on meds".
+# - Embeddings live in one preallocated (capacity x dim) matrix, so a lookup is a single matrix-vector
+#   product over the filled rows; evicted rows are reused in place.
+# - Bounded size with LRU eviction; hit rate and the similarity of hits are tracked for tuning the threshold.
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from vector_index import normalize_rows
+
+SEMANTIC_CACHE_SIZE = int(os.environ.get("SEMANTIC_CACHE_SIZE", "1024"))
+SEMANTIC_CACHE_THRESHOLD = float(os.environ.get("SEMANTIC_CACHE_THRESHOLD", "0.92"))
+
+
+class SemanticCache:
+    def __init__(self, max_entries=SEMANTIC_CACHE_SIZE, threshold=SEMANTIC_CACHE_THRESHOLD):
+        if max_entries < 1:
+            raise ValueError(f"max_entries must be at least 1, got {max_entries}")
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._matrix = None
+        # Row -> value, in LRU order (oldest first)
+        self._entries = OrderedDict()
+        self._next_row = 0
+        self.hits = 0
+        self.misses = 0
+        self.hit_similarity_sum = 0.0
+        self.min_hit_similarity = None
+
+    def lookup(self, embedding, threshold=None):
+        """Returns (value, similarity) for the closest entry at or above the threshold, else (None, best similarity).
+
+        threshold, when given, replaces the cache's own threshold for this lookup only.
+        """
+        threshold = self.threshold if threshold is None else threshold
+        query = normalize_rows(embedding)[0]
+        with self._lock:
+            if not self._entries:
+                self.misses += 1
+                return None, None
+            # Rows fill from the top and evictions reuse their row, so the filled rows are always a prefix
+            scores = self._matrix[:len(self._entries)] @ query
+            row = int(np.argmax(scores))
+            similarity = float(scores[row])
+            if similarity < threshold:
+                self.misses += 1
+                return None, similarity
+            self._entries.move_to_end(row)
+            self.hits += 1
+            self.hit_similarity_sum += similarity
+            self.min_hit_similarity = similarity if self.min_hit_similarity is None else min(self.min_hit_similarity, similarity)
+            return self._entries[row], similarity
+
+    def add(self, embedding, value):
+        vector = normalize_rows(embedding)[0]
+        with self._lock:
+            if self._matrix is None:
+                self._matrix = np.zeros((self.max_entries, vector.shape[0]), dtype=np.float32)
+            if self._next_row < self.max_entries:
+                row = self._next_row
+                self._next_row += 1
+            else:
+                row, _ = self._entries.popitem(last=False)
+            self._matrix[row] = vector
+            self._entries[row] = value
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "threshold": self.threshold,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "mean_hit_similarity": round(self.hit_similarity_sum / self.hits, 4) if self.hits else None,
+                "min_hit_similarity": round(self.min_hit_similarity, 4) if self.min_hit_similarity is not None else None,
+            }
@@ -0,0 +1,65 @@
+# Minimal dependency-graph scheduler for pipeline stages
+# - Each stage names the stages it depends on; a stage starts as soon as all of them have finished,
+#   so independent LLM calls overlap and total latency approaches the critical path.
+# - Per-stage start offsets and durations are recorded for every run.
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+
+class Stage:
+    def __init__(self, name, func, deps=()):
+        # func receives a dict of {dependency name: result}
+        self.name = name
+        self.func = func
+        self.deps = tuple(deps)
+
+
+def _timed(func, inputs):
+    start = time.perf_counter()
+    value = func(inputs)
+    return value, start, time.perf_counter() - start
+
+
+def run_stages(stages, executor=None, on_complete=None):
+    """Run stages respecting their dependencies; returns ({name: result}, {name: timing})."""
+    stages = {stage.name: stage for stage in stages}
+    for stage in stages.values():
+        unknown = [d for d in stage.deps if d not in stages]
+        if unknown:
+            raise ValueError(f"Stage {stage.name} depends on unknown stages: {unknown}")
+
+    own_executor = executor is None
+    if own_executor:
+        executor = ThreadPoolExecutor(max_workers=len(stages) or 1)
+
+    results = {}
+    timings = {}
+    pending = dict(stages)
+    running = {}
+    run_start = time.perf_counter()
+    try:
+        while pending or running:
+            ready = [s for s in pending.values() if all(d in results for d in s.deps)]
+            for stage in ready:
+                del pending[stage.name]
+                inputs = {d: results[d] for d in stage.deps}
+                running[executor.submit(_timed, stage.func, inputs)] = stage.name
+            if not running:
+                raise ValueError(f"Dependency cycle between stages: {sorted(pending)}")
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                value, start, elapsed = future.result()
+                results[name] = value
+                timings[name] = {"start": round(start - run_start, 4), "seconds": round(elapsed, 4)}
+                if on_complete is not None:
+                    on_complete(name, value)
+    finally:
+        for future in running:
+            future.cancel()
+        if own_executor:
+            executor.shutdown(wait=False)
+
+    timings["total"] = {"start": 0.0, "seconds": round(time.perf_counter() - run_start, 4)}
+    return results, timings
@@ -0,0 +1,54 @@
+# Parsing and validation of JSON answers from the LLM
+# - Models often wrap JSON in ```json fences or add a sentence around it, so the outermost {...} is extracted first.
+# - validate() checks the small JSON-schema subset our prompts use (object, string, enum, required), without
+#   needing the jsonschema package; enum values are matched case-insensitively and returned in canonical case.
+# - Any problem raises StructuredOutputError so callers can fall back to their free-text path.
+import json
+
+
+class StructuredOutputError(ValueError):
+    pass
+
+
+def extract_json(text):
+    start = text.find("{")
+    end = text.rfind("}")
+    if start == -1 or end < start:
+        raise StructuredOutputError("No JSON object in response")
+    try:
+        return json.loads(text[start:end + 1])
+    except json.JSONDecodeError as e:
+        raise StructuredOutputError(f"Invalid JSON in response: {e}") from e
+
+
+def validate(data, schema):
+    if not isinstance(data, dict):
+        raise StructuredOutputError(f"Expected a JSON object, got {type(data).__name__}")
+    missing = [key for key in schema.get("required", ()) if data.get(key) in (None, "")]
+    if missing:
+        raise StructuredOutputError(f"Missing fields: {missing}")
+
+    result = {}
+    for key, spec in schema.get("properties", {}).items():
+        if key not in data:
+            continue
+        value = data[key]
+        if spec.get("type") == "string":
+            if isinstance(value, (list, tuple)):
+                # Lists of points are common even when a string was asked for
+                value = "\n".join(f"- {item}" for item in value)
+            if not isinstance(value, str):
+                raise StructuredOutputError(f"Field {key!r} should be a string")
+            value = value.strip()
+        if "enum" in spec:
+            matches = [option for option in spec["enum"] if str(option).lower() == str(value).lower()]
+            if not matches:
+                raise StructuredOutputError(f"Field {key!r} should be one of {spec['enum']}, got {value!r}")
+            value = matches[0]
+        result[key] = value
+    return result
+
+
+def parse_structured(text, schema):
+    """Extract the JSON object from an LLM response and validate it against schema."""
+    return validate(extract_json(text), schema)
@@ -0,0 +1,66 @@
+# Checks that IntentRouter.from_retriever pairs each intent with its own embedding, whatever the index backend
+# Run: python -m pytest test_intent_router.py (or python test_intent_router.py)
+import numpy as np
+
+from intent_router import IntentRouter, intent_of_key
+from vector_index import DenseIndex, IVFIndex, QuantizedIndex, normalize_rows
+
+
+class StubRetriever:
+    # Just the parts of CorpusRetriever that from_retriever uses
+    def __init__(self, documents, index):
+        self.documents = documents
+        self.index = index
+        self.encoded = 0
+
+    def encode_corpus(self, texts):
+        self.encoded += 1
+        raise AssertionError("from_retriever should reuse the index's vectors, not encode the corpus")
+
+
+def make_corpus(intents=("appointment_scheduling", "medication_refill", "medical_records", "billing"), per_intent=6):
+    # Each intent's examples sit close to their own random direction
+    rng = np.random.default_rng(0)
+    directions = normalize_rows(rng.normal(size=(len(intents), 32)))
+    keys, rows = [], []
+    for i, intent in enumerate(intents):
+        for j in range(per_intent):
+            keys.append(f"{intent}:{j}")
+            rows.append(directions[i] + 0.05 * rng.normal(size=32))
+    return keys, normalize_rows(np.array(rows, dtype=np.float32)), directions
+
+
+def check_router(index_cls, **params):
+    keys, embeddings, directions = make_corpus()
+    index = index_cls(keys, embeddings, **params)
+    retriever = StubRetriever({key: key for key in keys}, index)
+    router = IntentRouter.from_retriever(retriever)
+
+    assert retriever.encoded == 0
+    np.testing.assert_allclose(index.vectors(), embeddings, atol=0.02)
+    for i, intent in enumerate(sorted({intent_of_key(key) for key in keys})):
+        assert router.intents[i] == intent
+    # Every example is classified as its own intent
+    for key, embedding in zip(keys, embeddings):
+        assert router.classify(embedding)[0] == intent_of_key(key)
+    return router
+
+
+def test_from_retriever_exact():
+    check_router(DenseIndex)
+
+
+def test_from_retriever_ivf():
+    # IVF stores rows grouped by cluster, not in key order
+    check_router(IVFIndex, nlist=3, nprobe=3)
+
+
+def test_from_retriever_quantized():
+    check_router(QuantizedIndex, dtype="int8", rescore=False)
+
+
+if __name__ == "__main__":
+    test_from_retriever_exact()
+    test_from_retriever_ivf()
+    test_from_retriever_quantized()
+    print("ok")
@@ -0,0 +1,97 @@
+# Checks that a semantic cache hit only hands back another sender's outputs when the emails are practically identical
+# Run: python -m pytest test_semantic_cache.py (or python test_semantic_cache.py)
+import hashlib
+import os
+
+import numpy as np
+
+# Token counts are estimated rather than loading a tokenizer
+os.environ.setdefault("LLM_TOKENIZER_DISABLED", "1")
+
+import EmailProcessor10 as ep
+from llm_cache import LLMCache
+from semantic_cache import SemanticCache
+
+FIRST = "Hi, this is Alice Smith. I'm almost out of my lisinopril, can you send a refill to my pharmacy?"
+# Same request from another patient: similar enough for the cache (0.95), not for verbatim reuse (0.99)
+SECOND = "Hi, this is Bob Jones. I'm almost out of my metformin, can you send a refill to my pharmacy?"
+VECTORS = {FIRST: [1.0, 0.0], SECOND: [0.95, (1 - 0.95 ** 2) ** 0.5]}
+
+
+class StubEncoder:
+    def encode(self, text):
+        return np.array(VECTORS[text], dtype=np.float32)
+
+
+class StubRetriever:
+    encoder = StubEncoder()
+
+    def get_relevant_response(self, query, top_k=2, memo=None):
+        return "Example response"
+
+    def get_relevant_policy(self, query, top_k=2, memo=None):
+        return "Refill policy"
+
+
+class StubClient:
+    # Every distinct prompt gets its own answer, so a reused output is recognizable
+    def __init__(self):
+        self.calls = 0
+
+    def chat(self, prompt, model, **params):
+        self.calls += 1
+        return {"choices": [{"message": {"content": "answer " + hashlib.sha256(prompt.encode()).hexdigest()[:12]}}]}
+
+
+def make_system(adapt_cached, monkeypatch):
+    monkeypatch.setattr(ep, "get_shared_retrievers", lambda: (StubRetriever(), StubRetriever()))
+    # A fresh LLM response cache, so every test counts its own calls
+    monkeypatch.setattr(ep, "llm_cache", LLMCache(sqlite_path=None))
+    client = StubClient()
+    cache = SemanticCache(max_entries=8, threshold=0.9)
+    system = ep.EmailProcessingSystem(client, fused_analysis=False, intent_routing=False,
+                                      semantic_cache=cache, adapt_cached=adapt_cached)
+    return system, client
+
+
+def test_near_duplicate_misses_without_adaptation(monkeypatch):
+    system, client = make_system(False, monkeypatch)
+    first = system.process_email(FIRST)
+    second = system.process_email(SECOND)
+
+    assert not second["semantic_cache"]["hit"]
+    assert second["final_draft"] != first["final_draft"]
+    assert second["analysis"] != first["analysis"]
+    assert client.calls == 12
+
+
+def test_near_duplicate_is_adapted(monkeypatch):
+    system, client = make_system(True, monkeypatch)
+    first = system.process_email(FIRST)
+    calls = client.calls
+    second = system.process_email(SECOND)
+
+    assert second["semantic_cache"]["hit"]
+    assert "matched_email" not in second["semantic_cache"]
+    for field in ("final_draft", "analysis", "review", "sentiment"):
+        assert second[field] != first[field]
+    assert second["policy_justification"] is None and second["example_justification"] is None
+    # analysis, sentiment, adapted draft and review
+    assert client.calls - calls == 4
+
+
+def test_identical_email_is_reused(monkeypatch):
+    system, client = make_system(False, monkeypatch)
+    first = system.process_email(FIRST)
+    calls = client.calls
+    second = system.process_email(FIRST)
+
+    assert second["semantic_cache"]["hit"]
+    assert second["final_draft"] == first["final_draft"]
+    assert client.calls == calls
+
+
+if __name__ == "__main__":
+    import pytest
+
+    raise SystemExit(pytest.main([__file__, "-q"]))
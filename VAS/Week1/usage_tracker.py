@@ -0,0 +1,104 @@
+# Token, cost and latency accounting for LLM calls
+# - Token counts come from the `usage` field the API returns with each chat completion.
+# - count_tokens() is a pre-flight estimate from the model's own tokenizer (loaded once and cached),
+#   falling back to ~4 characters per token when the tokenizer is not available.
+# - UsageLedger aggregates calls per agent role and per model; the app keeps one for the whole process
+#   and one per processed email.
+import functools
+import os
+import threading
+
+# USD per million tokens (input, output) - https://www.together.ai/pricing
+MODEL_PRICES = {
+    "meta-llama/Meta-Llama-3-8B-Instruct-Lite": (0.10, 0.10),
+    "meta-llama/Llama-3.3-70B-Instruct-Turbo": (0.88, 0.88),
+}
+DEFAULT_PRICE = (0.10, 0.10)
+
+# Together model name -> Hugging Face tokenizer
+TOKENIZERS = {
+    "meta-llama/Meta-Llama-3-8B-Instruct-Lite": "meta-llama/Meta-Llama-3-8B-Instruct",
+    "meta-llama/Llama-3.3-70B-Instruct-Turbo": "meta-llama/Llama-3.3-70B-Instruct",
+}
+
+
+@functools.lru_cache(maxsize=None)
+def load_tokenizer(model):
+    # Returns None (and remembers it) when transformers or the tokenizer files are unavailable
+    if os.environ.get("LLM_TOKENIZER_DISABLED"):
+        return None
+    try:
+        from transformers import AutoTokenizer
+        from ApiKey import HGToken
+
+        return AutoTokenizer.from_pretrained(TOKENIZERS.get(model, model), token=HGToken)
+    except Exception:
+        return None
+
+
+def count_tokens(text, model):
+    tokenizer = load_tokenizer(model)
+    if tokenizer is None:
+        return len(text) // 4 + 1
+    return len(tokenizer.encode(text, add_special_tokens=False))
+
+
+def cost_of(model, prompt_tokens, completion_tokens):
+    input_price, output_price = MODEL_PRICES.get(model, DEFAULT_PRICE)
+    return (prompt_tokens * input_price + completion_tokens * output_price) / 1_000_000
+
+
+def _empty_totals():
+    return {
+        "calls": 0,
+        "cached_calls": 0,
+        "estimated_calls": 0,
+        "prompt_tokens": 0,
+        "completion_tokens": 0,
+        "cost_usd": 0.0,
+        "seconds": 0.0,
+    }
+
+
+def _add(totals, prompt_tokens, completion_tokens, cost, seconds, cached, estimated):
+    totals["calls"] += 1
+    totals["cached_calls"] += int(cached)
+    totals["estimated_calls"] += int(estimated)
+    totals["prompt_tokens"] += prompt_tokens
+    totals["completion_tokens"] += completion_tokens
+    totals["cost_usd"] += cost
+    totals["seconds"] += seconds
+
+
+class UsageLedger:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.total = _empty_totals()
+        self.by_role = {}
+        self.by_model = {}
+
+    def record(self, role, model, prompt_tokens=0, completion_tokens=0, seconds=0.0, cached=False, estimated=False):
+        # Cached answers cost nothing, but are still counted as calls
+        cost = 0.0 if cached else cost_of(model, prompt_tokens, completion_tokens)
+        with self._lock:
+            for totals in (
+                self.total,
+                self.by_role.setdefault(role, _empty_totals()),
+                self.by_model.setdefault(model, _empty_totals()),
+            ):
+                _add(totals, prompt_tokens, completion_tokens, cost, seconds, cached, estimated)
+
+    def summary(self):
+        def rounded(totals):
+            return {**totals, "cost_usd": round(totals["cost_usd"], 8), "seconds": round(totals["seconds"], 4)}
+
+        with self._lock:
+            return {
+                "total": rounded(self.total),
+                "by_role": {role: rounded(t) for role, t in self.by_role.items()},
+                "by_model": {model: rounded(t) for model, t in self.by_model.items()},
+            }
+
+
+# Process-wide totals
+usage_tracker = UsageLedger()
@@ -0,0 +1,432 @@
+# Matrix-backed nearest-neighbour search for the retrievers
+# - The corpus lives in one L2-normalized float32 matrix, so cosine similarity is a single matrix product.
+# - Top-k uses argpartition instead of sorting every score, which matters once the corpus has thousands of rows.
+# - Large corpora can use an approximate backend instead: a pure-NumPy IVF index, or hnswlib / faiss-cpu when
+#   installed. All backends share the same search()/search_batch() interface and are built, saved and loaded
+#   offline (see build_index.py) rather than inside the retrievers.
+# - QuantizedIndex keeps the corpus as float16 or int8 (per-row scales) to cut RAM 2-4x, and rescores the
+#   best candidates against float32 rows that can stay memory-mapped on disk.
+import json
+import os
+
+import numpy as np
+
+from lazy_imports import is_available, lazy_import
+
+# Optional backends are imported on first use (faiss in particular is slow to import)
+hnswlib = lazy_import("hnswlib") if is_available("hnswlib") else None
+faiss = lazy_import("faiss") if is_available("faiss") else None
+
+
+def normalize_rows(matrix):
+    matrix = np.asarray(matrix, dtype=np.float32)
+    if matrix.ndim == 1:
+        matrix = matrix[None, :]
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+
+def top_k_indices(scores, top_k):
+    # Indices of the k highest scores in each row, best first
+    top_k = min(top_k, scores.shape[-1])
+    if top_k <= 0:
+        return np.empty(scores.shape[:-1] + (0,), dtype=np.int64)
+    if top_k < scores.shape[-1]:
+        candidates = np.argpartition(-scores, top_k - 1, axis=-1)[..., :top_k]
+    else:
+        candidates = np.broadcast_to(np.arange(scores.shape[-1]), scores.shape[:-1] + (top_k,))
+    order = np.argsort(-np.take_along_axis(scores, candidates, axis=-1), axis=-1, kind="stable")
+    return np.take_along_axis(candidates, order, axis=-1)
+
+
+def _read_meta(directory):
+    with open(os.path.join(directory, "index.json"), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _write_meta(directory, meta):
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, "index.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+
+
+class VectorIndex:
+    # Common interface: subclasses implement _search_ids(queries, top_k) -> (ids, scores)
+    backend = None
+
+    def __len__(self):
+        return len(self.keys)
+
+    def set_search_params(self, **params):
+        # Query-time knobs (nprobe, ef, ...) trade recall for latency without rebuilding
+        for name, value in params.items():
+            if not hasattr(self, name):
+                raise ValueError(f"Unknown search parameter for {self.backend} index: {name}")
+            setattr(self, name, value)
+
+    def vectors(self):
+        # Normalized rows in the same order as self.keys, or None when the backend can't give them back
+        return None
+
+    def search(self, query_embedding, top_k=2, threshold=None):
+        return self.search_batch([query_embedding], top_k, threshold)[0]
+
+    def search_batch(self, query_embeddings, top_k=2, threshold=None):
+        queries = normalize_rows(query_embeddings)
+        ids, scores = self._search_ids(queries, top_k)
+
+        results = []
+        for row_ids, row_scores in zip(ids, scores):
+            matches = []
+            for i, score in zip(row_ids, row_scores):
+                if i < 0:
+                    continue
+                score = float(score)
+                if threshold is None or score > threshold:
+                    matches.append((self.keys[i], score))
+            results.append(matches)
+        return results
+
+
+class DenseIndex(VectorIndex):
+    # Exact brute-force search
+    backend = "exact"
+
+    def __init__(self, keys, embeddings, normalized=False):
+        self.keys = list(keys)
+        # Already-normalized matrices (e.g. memory-mapped cache files) are used as-is, without a copy
+        self.matrix = embeddings if normalized else normalize_rows(embeddings)
+        if len(self.keys) != self.matrix.shape[0]:
+            raise ValueError("Number of keys does not match number of embeddings")
+
+    def vectors(self):
+        return self.matrix
+
+    def _search_ids(self, queries, top_k):
+        # One (queries x corpus) matmul for the whole batch
+        scores = queries @ self.matrix.T
+        indices = top_k_indices(scores, top_k)
+        return indices, np.take_along_axis(scores, indices, axis=-1)
+
+    def save(self, directory):
+        _write_meta(directory, {"backend": self.backend, "keys": self.keys})
+        np.save(os.path.join(directory, "matrix.npy"), self.matrix)
+
+    @classmethod
+    def load(cls, directory, **search_params):
+        meta = _read_meta(directory)
+        index = cls(meta["keys"], np.load(os.path.join(directory, "matrix.npy"), mmap_mode="r"), normalized=True)
+        index.set_search_params(**search_params)
+        return index
+
+
+QUANTIZED_DTYPES = ("float16", "int8")
+
+
+def quantize_rows(matrix, dtype):
+    # Returns (codes, per-row scales or None); int8 is symmetric, scaled so each row's largest value maps to 127
+    if dtype == "float16":
+        return matrix.astype(np.float16), None
+    if dtype == "int8":
+        scales = np.maximum(np.abs(matrix).max(axis=1) / 127.0, 1e-12).astype(np.float32)
+        return np.round(matrix / scales[:, None]).astype(np.int8), scales
+    raise ValueError(f"Unknown quantized dtype: {dtype} (choose from {', '.join(QUANTIZED_DTYPES)})")
+
+
+class QuantizedIndex(VectorIndex):
+    # Exact scan over compact float16/int8 rows, then optional float32 rescoring of the top candidates
+    backend = "quantized"
+
+    def __init__(self, keys, embeddings, dtype="int8", rescore=True, rescore_factor=4, chunk_size=65536,
+                 normalized=False):
+        self.keys = list(keys)
+        matrix = embeddings if normalized else normalize_rows(embeddings)
+        if len(self.keys) != matrix.shape[0]:
+            raise ValueError("Number of keys does not match number of embeddings")
+        self.dtype = dtype
+        self.codes, self.scales = quantize_rows(np.asarray(matrix, dtype=np.float32), dtype)
+        # float32 rows for rescoring; a memory-mapped matrix (cache file, saved index) is not copied into RAM
+        self.full = matrix if rescore else None
+        self.rescore = rescore
+        self.rescore_factor = rescore_factor
+        self.chunk_size = chunk_size
+
+    def vectors(self):
+        if self.full is not None:
+            return self.full
+        # No float32 copy kept: decode the compact rows (close enough for centroids and the like)
+        rows = self.codes.astype(np.float32)
+        return rows * self.scales[:, None] if self.scales is not None else rows
+
+    def _compact_scores(self, queries):
+        # Decode one chunk at a time so only chunk_size rows are ever held as float32
+        scores = np.empty((len(queries), len(self.codes)), dtype=np.float32)
+        for start in range(0, len(self.codes), self.chunk_size):
+            end = start + self.chunk_size
+            block = queries @ self.codes[start:end].astype(np.float32).T
+            if self.scales is not None:
+                block *= self.scales[start:end]
+            scores[:, start:end] = block
+        return scores
+
+    def _search_ids(self, queries, top_k):
+        scores = self._compact_scores(queries)
+        if not self.rescore or self.full is None:
+            indices = top_k_indices(scores, top_k)
+            return indices, np.take_along_axis(scores, indices, axis=-1)
+
+        candidates = top_k_indices(scores, top_k * max(1, self.rescore_factor))
+        ids = np.full((len(queries), min(top_k, candidates.shape[1])), -1, dtype=np.int64)
+        exact = np.zeros(ids.shape, dtype=np.float32)
+        for q, (query, rows) in enumerate(zip(queries, candidates)):
+            # Reads only the candidate rows from the float32 matrix
+            order = np.sort(rows)
+            candidate_scores = np.asarray(self.full[order], dtype=np.float32) @ query
+            best = top_k_indices(candidate_scores, ids.shape[1])
+            ids[q] = order[best]
+            exact[q] = candidate_scores[best]
+        return ids, exact
+
+    def save(self, directory):
+        _write_meta(directory, {
+            "backend": self.backend,
+            "keys": self.keys,
+            "dtype": self.dtype,
+            "rescore": self.full is not None,
+            "rescore_factor": self.rescore_factor,
+        })
+        np.save(os.path.join(directory, "codes.npy"), self.codes)
+        if self.scales is not None:
+            np.save(os.path.join(directory, "scales.npy"), self.scales)
+        if self.full is not None:
+            np.save(os.path.join(directory, "matrix.npy"), self.full)
+
+    @classmethod
+    def load(cls, directory, **search_params):
+        meta = _read_meta(directory)
+        index = cls.__new__(cls)
+        index.keys = meta["keys"]
+        index.dtype = meta["dtype"]
+        index.rescore = meta["rescore"]
+        index.rescore_factor = meta["rescore_factor"]
+        index.chunk_size = 65536
+        # Compact codes are loaded into RAM; the float32 rows stay on disk and are paged in per candidate
+        index.codes = np.load(os.path.join(directory, "codes.npy"))
+        scales_path = os.path.join(directory, "scales.npy")
+        index.scales = np.load(scales_path) if os.path.exists(scales_path) else None
+        index.full = np.load(os.path.join(directory, "matrix.npy"), mmap_mode="r") if meta["rescore"] else None
+        index.set_search_params(**search_params)
+        return index
+
+
+def _assign(matrix, centroids, chunk_size=8192):
+    # Nearest centroid per row, chunked so the score matrix stays small
+    assignments = np.empty(len(matrix), dtype=np.int64)
+    for start in range(0, len(matrix), chunk_size):
+        assignments[start:start + chunk_size] = np.argmax(matrix[start:start + chunk_size] @ centroids.T, axis=1)
+    return assignments
+
+
+def _spherical_kmeans(matrix, n_clusters, iterations, rng):
+    centroids = matrix[rng.choice(len(matrix), n_clusters, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = _assign(matrix, centroids)
+        counts = np.bincount(assignments, minlength=n_clusters)
+        order = np.argsort(assignments, kind="stable")
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        filled = counts > 0
+        centroids[filled] = np.add.reduceat(matrix[order], starts[filled], axis=0)
+        # Re-seed empty clusters with random rows
+        if not filled.all():
+            centroids[~filled] = matrix[rng.choice(len(matrix), int((~filled).sum()), replace=False)]
+        centroids = normalize_rows(centroids)
+    return centroids
+
+
+class IVFIndex(VectorIndex):
+    # Pure-NumPy inverted-file index: k-means coarse clusters, then exact scoring of the nprobe closest lists
+    backend = "ivf"
+
+    def __init__(self, keys, embeddings, nlist=None, nprobe=8, iterations=10, train_size=50000, seed=0):
+        self.keys = list(keys)
+        matrix = normalize_rows(embeddings)
+        rng = np.random.default_rng(seed)
+        nlist = min(nlist or max(1, int(np.sqrt(len(matrix)))), len(matrix))
+
+        sample = matrix
+        if len(matrix) > train_size:
+            sample = matrix[rng.choice(len(matrix), train_size, replace=False)]
+        self.centroids = _spherical_kmeans(sample, nlist, iterations, rng)
+
+        # Store rows grouped by list so each probe scans one contiguous block
+        assignments = _assign(matrix, self.centroids)
+        order = np.argsort(assignments, kind="stable")
+        self.ids = order
+        self.matrix = matrix[order]
+        self.offsets = np.searchsorted(assignments[order], np.arange(nlist + 1))
+        self.nprobe = nprobe
+
+    def vectors(self):
+        # self.matrix is grouped by list; ids maps each of its rows back to its key position
+        rows = np.empty(self.matrix.shape, dtype=self.matrix.dtype)
+        rows[self.ids] = self.matrix
+        return rows
+
+    def _search_ids(self, queries, top_k):
+        nlist = len(self.centroids)
+        probes = top_k_indices(queries @ self.centroids.T, min(self.nprobe, nlist))
+
+        ids = np.full((len(queries), top_k), -1, dtype=np.int64)
+        scores = np.zeros((len(queries), top_k), dtype=np.float32)
+        for q, (query, lists) in enumerate(zip(queries, probes)):
+            rows = np.concatenate([np.arange(self.offsets[l], self.offsets[l + 1]) for l in lists])
+            if len(rows) == 0:
+                continue
+            candidate_scores = self.matrix[rows] @ query
+            best = top_k_indices(candidate_scores, top_k)
+            ids[q, :len(best)] = self.ids[rows[best]]
+            scores[q, :len(best)] = candidate_scores[best]
+        return ids, scores
+
+    def save(self, directory):
+        _write_meta(directory, {"backend": self.backend, "keys": self.keys, "nprobe": self.nprobe})
+        for name in ("centroids", "matrix", "ids", "offsets"):
+            np.save(os.path.join(directory, f"{name}.npy"), getattr(self, name))
+
+    @classmethod
+    def load(cls, directory, **search_params):
+        meta = _read_meta(directory)
+        index = cls.__new__(cls)
+        index.keys = meta["keys"]
+        index.nprobe = meta["nprobe"]
+        for name in ("centroids", "matrix", "ids", "offsets"):
+            setattr(index, name, np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r"))
+        index.set_search_params(**search_params)
+        return index
+
+
+class HnswlibIndex(VectorIndex):
+    # Graph index from hnswlib (pip install hnswlib)
+    backend = "hnswlib"
+
+    def __init__(self, keys, embeddings, M=16, ef_construction=200, ef=64):
+        if hnswlib is None:
+            raise ImportError("The hnswlib backend needs: pip install hnswlib")
+        self.keys = list(keys)
+        matrix = normalize_rows(embeddings)
+        self.index = hnswlib.Index(space="ip", dim=matrix.shape[1])
+        self.index.init_index(max_elements=len(matrix), ef_construction=ef_construction, M=M)
+        self.index.add_items(matrix, np.arange(len(matrix)))
+        self.ef = ef
+
+    def vectors(self):
+        return np.asarray(self.index.get_items(np.arange(len(self.keys))), dtype=np.float32)
+
+    def _search_ids(self, queries, top_k):
+        top_k = min(top_k, len(self.keys))
+        self.index.set_ef(max(self.ef, top_k))
+        labels, distances = self.index.knn_query(queries, k=top_k)
+        # Inner-product distance is 1 - similarity
+        return labels.astype(np.int64), 1.0 - distances
+
+    def save(self, directory):
+        _write_meta(directory, {
+            "backend": self.backend, "keys": self.keys, "ef": self.ef, "dim": self.index.dim,
+        })
+        self.index.save_index(os.path.join(directory, "hnsw.bin"))
+
+    @classmethod
+    def load(cls, directory, **search_params):
+        if hnswlib is None:
+            raise ImportError("The hnswlib backend needs: pip install hnswlib")
+        meta = _read_meta(directory)
+        index = cls.__new__(cls)
+        index.keys = meta["keys"]
+        index.ef = meta["ef"]
+        index.index = hnswlib.Index(space="ip", dim=meta["dim"])
+        index.index.load_index(os.path.join(directory, "hnsw.bin"), max_elements=len(index.keys))
+        index.set_search_params(**search_params)
+        return index
+
+
+class FaissIndex(VectorIndex):
+    # IVF-Flat index from faiss (pip install faiss-cpu)
+    backend = "faiss"
+
+    def __init__(self, keys, embeddings, nlist=None, nprobe=8):
+        if faiss is None:
+            raise ImportError("The faiss backend needs: pip install faiss-cpu")
+        self.keys = list(keys)
+        matrix = np.ascontiguousarray(normalize_rows(embeddings))
+        nlist = min(nlist or max(1, int(np.sqrt(len(matrix)))), len(matrix))
+        quantizer = faiss.IndexFlatIP(matrix.shape[1])
+        self.index = faiss.IndexIVFFlat(quantizer, matrix.shape[1], nlist, faiss.METRIC_INNER_PRODUCT)
+        self.index.train(matrix)
+        self.index.add(matrix)
+        self.nprobe = nprobe
+
+    def _search_ids(self, queries, top_k):
+        self.index.nprobe = self.nprobe
+        scores, ids = self.index.search(np.ascontiguousarray(queries), min(top_k, len(self.keys)))
+        return ids, scores
+
+    def save(self, directory):
+        _write_meta(directory, {"backend": self.backend, "keys": self.keys, "nprobe": self.nprobe})
+        faiss.write_index(self.index, os.path.join(directory, "faiss.index"))
+
+    @classmethod
+    def load(cls, directory, **search_params):
+        if faiss is None:
+            raise ImportError("The faiss backend needs: pip install faiss-cpu")
+        meta = _read_meta(directory)
+        index = cls.__new__(cls)
+        index.keys = meta["keys"]
+        index.nprobe = meta["nprobe"]
+        index.index = faiss.read_index(os.path.join(directory, "faiss.index"))
+        index.set_search_params(**search_params)
+        return index
+
+
+INDEX_BACKENDS = {
+    "exact": DenseIndex,
+    "ivf": IVFIndex,
+    "hnswlib": HnswlibIndex,
+    "faiss": FaissIndex,
+    "quantized": QuantizedIndex,
+}
+
+
+def build_index(backend, keys, embeddings, **params):
+    if backend not in INDEX_BACKENDS:
+        raise ValueError(f"Unknown index backend: {backend} (choose from {', '.join(INDEX_BACKENDS)})")
+    return INDEX_BACKENDS[backend](keys, embeddings, **params)
+
+
+def load_index(directory, **search_params):
+    backend = _read_meta(directory)["backend"]
+    return INDEX_BACKENDS[backend].load(directory, **search_params)
+
+
+def memory_report(index):
+    # Bytes held in RAM vs memory-mapped from disk (only touched pages of a mapping become resident)
+    report = {"backend": index.backend, "vectors": len(index), "resident_bytes": 0, "mapped_bytes": 0, "arrays": {}}
+    for name, value in vars(index).items():
+        if not isinstance(value, np.ndarray):
+            continue
+        mapped = isinstance(value, np.memmap) or isinstance(getattr(value, "base", None), np.memmap)
+        report["arrays"][name] = {"dtype": str(value.dtype), "shape": list(value.shape), "bytes": value.nbytes,
+                                  "mapped": mapped}
+        report["mapped_bytes" if mapped else "resident_bytes"] += value.nbytes
+    return report
+
+
+def recall_at_k(index, exact_index, queries, top_k=10):
+    """Mean fraction of the exact top-k keys that index also returns."""
+    found = index.search_batch(queries, top_k)
+    expected = exact_index.search_batch(queries, top_k)
+    recalls = [
+        len({key for key, _ in got} & {key for key, _ in want}) / len(want)
+        for got, want in zip(found, expected)
+        if want
+    ]
+    return float(np.mean(recalls)) if recalls else 1.0
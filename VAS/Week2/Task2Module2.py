@@ -1,6 +1,7 @@
 import gradio as gr
 import json
 from together import Together
+from llm_cache import llm_cache
 import os
 
 
@@ -236,14 +237,18 @@ dataset = {
 }
 
 
-def prompt_llm(prompt):
+def prompt_llm(prompt, use_cache=True):
     # TODO 2: You can experiment with different models here (see here https://api.together.ai/models)
     model = "meta-llama/Llama-3.3-70B-Instruct-Turbo"
-    response = client.chat.completions.create(
-        model=model,
-        messages=[{"role": "user", "content": prompt}],
-    )
-    return response.choices[0].message.content
+
+    def call():
+        response = client.chat.completions.create(
+            model=model,
+            messages=[{"role": "user", "content": prompt}],
+        )
+        return response.choices[0].message.content
+
+    return llm_cache.get_or_call(model, prompt, {}, call, use_cache)
 
 
 def show_data_point(index):
@@ -1,6 +1,7 @@
 import gradio as gr
 import json
 from together import Together
+from llm_cache import llm_cache
 import os
 
 # Get the current notebook directory
@@ -234,13 +235,18 @@ dataset = {
 # TODO: 1. Customize your API key or use environment variables for security
 client = Together(api_key=together_ai_token)
 
-def prompt_llm(prompt):
+def prompt_llm(prompt, use_cache=True):
     model = "meta-llama/Meta-Llama-3-8B-Instruct-Lite"
-    response = client.chat.completions.create(
-        model=model,
-        messages=[{"role": "user", "content": prompt}],
-    )
-    return response.choices[0].message.content
+
+    def call():
+        response = client.chat.completions.create(
+            model=model,
+            messages=[{"role": "user", "content": prompt}],
+        )
+        return response.choices[0].message.content
+
+    # Re-running the same quiz items hits the response cache instead of the API
+    return llm_cache.get_or_call(model, prompt, {}, call, use_cache)
 
 
 def show_data_point(index):
@@ -1,6 +1,7 @@
 import gradio as gr
 import json
 from together import Together
+from llm_cache import llm_cache
 
 
 # TODO 1: Replace with your Together API key (https://www.together.ai/)
@@ -35,14 +36,18 @@ with open(prompt_template_path, 'r') as f:
     prompt_template_data = json.load(f)
     prompt_template = prompt_template_data.get("prompt_template", "")
 
-def prompt_llm(prompt):
+def prompt_llm(prompt, use_cache=True):
     # TODO 2: You can experiment with different models here (see here https://api.together.ai/models)
     model = model_name
-    response = client.chat.completions.create(
-        model=model,
-        messages=[{"role": "user", "content": prompt}],
-    )
-    return response.choices[0].message.content
+
+    def call():
+        response = client.chat.completions.create(
+            model=model,
+            messages=[{"role": "user", "content": prompt}],
+        )
+        return response.choices[0].message.content
+
+    return llm_cache.get_or_call(model, prompt, {}, call, use_cache)
 
 
 def load_dataset():
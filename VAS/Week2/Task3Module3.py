@@ -2,6 +2,7 @@ import gradio as gr
 import json
 import os
 from together import Together
+from llm_cache import llm_cache
 
 # Get the current directory
 current_dir = os.path.dirname(os.path.abspath("__file__"))
@@ -49,13 +50,18 @@ def load_dataset():
 # Load the dataset
 dataset = load_dataset()
 
-def prompt_llm(prompt):
+def prompt_llm(prompt, use_cache=True):
     model = model_name
-    response = client.chat.completions.create(
-        model=model,
-        messages=[{"role": "user", "content": prompt}],
-    )
-    return response.choices[0].message.content
+
+    def call():
+        response = client.chat.completions.create(
+            model=model,
+            messages=[{"role": "user", "content": prompt}],
+        )
+        return response.choices[0].message.content
+
+    # Re-running the same quiz items hits the response cache instead of the API
+    return llm_cache.get_or_call(model, prompt, {}, call, use_cache)
 
 def show_data_point(index):
     input_data = dataset["input"][index]